@@ -11,6 +11,7 @@ import os
 import sys
 import json
 import logging
+import logging.handlers
 import re
 from datetime import datetime
 
@@ -20,7 +21,7 @@ from datetime import datetime
 CONFIG_FILE = "config.json"
 SCRIPT_VERSION = open(os.path.join(os.path.dirname(__file__), "VERSION.txt")).read().strip()
 
-def load_config():
+def load_config(path=CONFIG_FILE):
     defaults = {
         "bay_number": 1,
         "pos_server_url": "",
@@ -28,6 +29,10 @@ def load_config():
         "capture_interval_seconds": 0.5,
         "ocr_language": ["en"],
         "log_file": "score_capture.log",
+        "log_level": "DEBUG",           # file log level (DEBUG / INFO / WARNING)
+        "log_max_mb": 10,               # rotate log file at this size
+        "log_backup_count": 5,          # rotated files to keep
+        "log_format": "text",           # "text" or "jsonl" (structured, one JSON object per line)
         "save_captures": True,
         "capture_save_dir": "captures",
         "cooldown_seconds": 120,
@@ -40,33 +45,528 @@ def load_config():
         "score_region": {"x": 0.68, "y": 0.40, "w": 0.10, "h": 0.17},
         # Course name region
         "course_region": {"x": 0.24, "y": 0.05, "w": 0.30, "h": 0.07},
+        # Player rows in the table: "auto" (from OCR box positions) or a fixed count
+        "table_rows": "auto",
+        # Replay buffer — rolling JPEG history kept in memory for disputes
+        "replay_enabled": True,
+        "replay_seconds": 60,
+        "replay_max_mb": 24,
+        "replay_width": 640,
+        "replay_jpeg_quality": 60,
+        "replay_dir": "replays",
+        "replay_trigger_file": "dump_replay.flag",
+        "replay_keep_clips": 200,       # clips kept on disk (0 = no limit)
+        "replay_keep_days": 14,         # delete clips older than this (0 = no limit)
+        "replay_keep_mb": 2048,         # delete oldest clips past this total size (0 = no limit)
+        # Stuck screen detection — dumps the replay buffer when the screen freezes
+        "stuck_threshold": 0.005,
+        "stuck_alert_minutes": 3,
+        # Color pre-filter profiles — one per scorecard look (see --calibrate)
+        "prefilter_profiles": {"scorecard": dict(_DEFAULT_PREFILTER_PROFILE)},
+        "prefilter_patch": 3,           # average a patch x patch square around each point
+        # How often to check config.json for changes (0 disables hot-reload)
+        "config_poll_seconds": 2,
+        # Frame bus — grabber + detector/health/recorder processes over shared memory
+        "frame_bus_enabled": False,
+        "frame_bus_slots": 4,
+        "health_check_interval_seconds": 2,
+        # Local capture archive (SQLite index + JPEGs) — query with --query
+        "archive_enabled": True,
+        "archive_dir": "archive",
+        "archive_max_days": 180,
+        "archive_max_mb": 2048,
+        "archive_jpeg_quality": 85,
+        # Profiling (also enabled by --profile); can be toggled live via hot-reload
+        "profile_enabled": False,
+        "profile_dir": "profiles",
+        "profile_dump_seconds": 300,
+        "profile_sample_every": 10,     # profile per-frame stages on every Nth frame
+        "profile_top_n": 15,
+        "profile_keep": 12,             # number of dumps to keep
     }
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
+    if os.path.exists(path):
+        with open(path, "r") as f:
             user_cfg = json.load(f)
             defaults.update(user_cfg)
     return defaults
 
+
+# Keys that are only read at startup. Changes are reported but not applied.
+RESTART_REQUIRED_KEYS = {
+    "bay_number",
+    "ocr_language",
+    "log_file",
+    "log_level",
+    "log_max_mb",
+    "log_backup_count",
+    "log_format",
+    "replay_enabled",
+    "replay_seconds",
+    "replay_max_mb",
+    "replay_width",
+    "replay_jpeg_quality",
+    "replay_dir",
+    "replay_keep_clips",
+    "replay_keep_days",
+    "replay_keep_mb",
+    "config_poll_seconds",
+    "frame_bus_enabled",
+    "frame_bus_slots",
+    "archive_enabled",
+    "archive_dir",
+}
+REGION_KEYS = ("detect_region", "name_region", "score_region", "course_region")
+UPLOAD_KEYS = ("google_drive_client_secret", "google_drive_folder_id")
+
+
+def validate_config(cfg):
+    """Return a list of problems with cfg (empty list = valid)."""
+    errors = []
+    if not isinstance(cfg.get("bay_number"), int):
+        errors.append("bay_number must be an integer")
+    for key in ("capture_interval_seconds", "cooldown_seconds", "confidence_threshold",
+                "stuck_threshold", "stuck_alert_minutes"):
+        value = cfg.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            errors.append(f"{key} must be a non-negative number")
+    if isinstance(cfg.get("capture_interval_seconds"), (int, float)) and cfg["capture_interval_seconds"] <= 0:
+        errors.append("capture_interval_seconds must be greater than 0")
+    for key in REGION_KEYS:
+        region = cfg.get(key)
+        if not isinstance(region, dict) or not all(
+            isinstance(region.get(k), (int, float)) for k in ("x", "y", "w", "h")
+        ):
+            errors.append(f"{key} must have numeric x, y, w, h")
+            continue
+        if (min(region["x"], region["y"]) < 0 or min(region["w"], region["h"]) <= 0
+                or region["x"] + region["w"] > 1.0001 or region["y"] + region["h"] > 1.0001):
+            errors.append(f"{key} must lie within the screen (ratios 0.0 - 1.0)")
+    if not isinstance(cfg.get("frame_bus_slots"), int) or cfg["frame_bus_slots"] < 2:
+        errors.append("frame_bus_slots must be an integer >= 2")
+    value = cfg.get("health_check_interval_seconds")
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        errors.append("health_check_interval_seconds must be greater than 0")
+    for key in ("archive_max_days", "archive_max_mb",
+                "replay_keep_clips", "replay_keep_days", "replay_keep_mb"):
+        value = cfg.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            errors.append(f"{key} must be a non-negative number (0 = no limit)")
+    for key in ("profile_sample_every", "profile_top_n", "profile_keep"):
+        value = cfg.get(key)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            errors.append(f"{key} must be a positive integer")
+    value = cfg.get("profile_dump_seconds")
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        errors.append("profile_dump_seconds must be greater than 0")
+    if not isinstance(cfg.get("profile_dir"), str) or not cfg["profile_dir"]:
+        errors.append("profile_dir must be a directory path")
+    if str(cfg.get("log_level")).upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        errors.append("log_level must be DEBUG, INFO, WARNING, ERROR or CRITICAL")
+    if not isinstance(cfg.get("log_file"), str) or not cfg["log_file"]:
+        errors.append("log_file must be a file path")
+    for key in ("log_max_mb", "replay_seconds", "replay_max_mb"):
+        value = cfg.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            errors.append(f"{key} must be greater than 0")
+    value = cfg.get("config_poll_seconds")
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        errors.append("config_poll_seconds must be a non-negative number (0 = no hot-reload)")
+    value = cfg.get("log_backup_count")
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        errors.append("log_backup_count must be a non-negative integer")
+    value = cfg.get("replay_width")
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        errors.append("replay_width must be a positive integer")
+    for key in ("replay_jpeg_quality", "archive_jpeg_quality"):
+        value = cfg.get(key)
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= 100:
+            errors.append(f"{key} must be an integer from 1 to 100")
+    if cfg.get("log_format") not in ("text", "jsonl"):
+        errors.append('log_format must be "text" or "jsonl"')
+    rows = cfg.get("table_rows")
+    if rows != "auto" and (isinstance(rows, bool) or not isinstance(rows, int) or rows < 1):
+        errors.append('table_rows must be "auto" or a positive integer')
+    patch = cfg.get("prefilter_patch")
+    if not isinstance(patch, int) or patch < 1 or patch % 2 == 0:
+        errors.append("prefilter_patch must be an odd integer >= 1")
+    profiles = cfg.get("prefilter_profiles")
+    if not isinstance(profiles, dict) or not profiles:
+        errors.append("prefilter_profiles must map profile names to profiles")
+        profiles = {}
+    for name, profile in profiles.items():
+        try:
+            ColorPrefilter.normalize_profile(profile)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"prefilter_profiles.{name}: {e}")
+    return errors
+
+
+class ConfigWatcher:
+    """Watches config.json in a background thread and stages validated changes.
+    The capture loop picks them up with take() between frames, so a new config
+    is swapped in atomically — never halfway through processing a frame.
+    """
+
+    def __init__(self, cfg, log, path=CONFIG_FILE, overrides=None, report=True):
+        import threading
+        self.log = log
+        self.path = path
+        # Frame-bus consumers watch the same file as the main process; only one reports
+        self.report = report
+        # Command-line settings (e.g. --profile) win over the file until the file
+        # itself sets or changes that key — from then on the file's value is used
+        self.overrides = overrides or {}
+        self._file_at_start = self._read_file_keys(self.overrides)
+        self.interval = cfg["config_poll_seconds"]
+        self._current = cfg
+        self._pending = None
+        self._mtime = self._get_mtime()
+        self._lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._watch_loop, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def _read_file_keys(self, keys):
+        """Values of keys as written in the file ({} if it is missing or unreadable)."""
+        try:
+            with open(self.path, "r") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {k: raw[k] for k in keys if isinstance(raw, dict) and k in raw}
+
+    def _get_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _watch_loop(self):
+        while self._running:
+            time.sleep(self.interval)
+            mtime = self._get_mtime()
+            if mtime == self._mtime:
+                continue
+            self._mtime = mtime
+            try:
+                new_cfg = load_config(self.path)
+                in_file = self._read_file_keys(self.overrides)
+                start = self._file_at_start
+                new_cfg.update({
+                    k: v for k, v in self.overrides.items()
+                    if (k in in_file, in_file.get(k)) == (k in start, start.get(k))
+                })
+            except Exception as e:
+                if self.report:
+                    self.log.error("Config reload failed — keeping current config: %s", e)
+                continue
+            errors = validate_config(new_cfg)
+            if errors:
+                if self.report:
+                    self.log.error("Config reload rejected — keeping current config: %s", '; '.join(errors))
+                continue
+            with self._lock:
+                base = self._pending[0] if self._pending else self._current
+            changed = sorted(k for k in set(base) | set(new_cfg) if base.get(k) != new_cfg.get(k))
+            restart = [k for k in changed if k in RESTART_REQUIRED_KEYS]
+            applied = [k for k in changed if k not in RESTART_REQUIRED_KEYS]
+            if restart:
+                if self.report:
+                    self.log.warning("Config changes need a restart to take effect: %s", ', '.join(restart))
+                for k in restart:
+                    if k in base:
+                        new_cfg[k] = base[k]
+                    else:
+                        new_cfg.pop(k, None)
+            if not applied:
+                continue
+            with self._lock:
+                self._pending = (new_cfg, applied)
+
+    def take(self):
+        """Return (new_cfg, changed_keys) if a validated change is waiting, else None."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending:
+                self._current = pending[0]
+        return pending
+
+    def close(self):
+        self._running = False
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
-def setup_logging(log_file):
+# Optional per-stage fields, passed via extra={...} on log calls
+LOG_FIELDS = ("frame", "stage", "duration_ms")
+
+
+class JsonlFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message, bay and any stage fields."""
+
+    def __init__(self, bay_number):
+        super().__init__()
+        self.bay_number = bay_number
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "bay": self.bay_number,
+            "message": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback separate from the message.
+    The stock prepare() folds the traceback into msg and drops exc_info, which
+    hides it from JsonlFormatter. Here it travels as exc_text (a plain string,
+    so records still pickle across the frame-bus process queue).
+    """
+
+    def prepare(self, record):
+        import copy
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def setup_logging(cfg, log_queue=None, listen=True):
+    """Log through a queue so the capture loop never waits on disk I/O.
+    A QueueListener thread owns the rotating file handler and the console.
+    log_queue: queue to log through (a multiprocessing.Queue in frame-bus mode).
+    listen=False: frame-bus consumer process — only enqueue; the main process writes.
+    """
+    import atexit
+    import queue
+    from logging.handlers import QueueListener, RotatingFileHandler
+
+    file_level = getattr(logging, str(cfg["log_level"]).upper(), logging.DEBUG)
     logger = logging.getLogger("score_capture")
-    logger.setLevel(logging.DEBUG)
-    # File handler - detailed
-    fh = logging.FileHandler(log_file, encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-    ))
-    logger.addHandler(fh)
+    # Logger level = most verbose handler, so disabled DEBUG calls cost nothing
+    logger.setLevel(min(file_level, logging.INFO))
+    logger.propagate = False
+    logger.handlers.clear()
+
+    if log_queue is None:
+        log_queue = queue.Queue(-1)
+    logger.addHandler(TracebackQueueHandler(log_queue))
+    if not listen:
+        return logger
+
+    # File handler - detailed, size-rotated
+    fh = RotatingFileHandler(
+        cfg["log_file"], maxBytes=int(cfg["log_max_mb"] * 1024 * 1024),
+        backupCount=cfg["log_backup_count"], encoding="utf-8",
+    )
+    fh.setLevel(file_level)
+    if cfg["log_format"] == "jsonl":
+        fh.setFormatter(JsonlFormatter(cfg["bay_number"]))
+    else:
+        fh.setFormatter(logging.Formatter(
+            "%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        ))
     # Console handler - minimal
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
     ch.setFormatter(logging.Formatter("%(message)s"))
-    logger.addHandler(ch)
+
+    listener = QueueListener(log_queue, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     return logger
 
+def log_stage(log, stage, started, frame=None):
+    """Log how long a pipeline stage took (started = time.perf_counter() value).
+    In jsonl mode the stage, frame number and duration become structured fields.
+    """
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    log.info("Stage %s took %.1fms", stage, duration_ms,
+             extra={"frame": frame, "stage": stage, "duration_ms": duration_ms})
+
+# ---------------------------------------------------------------------------
+# Profiling: per-stage CPU + allocation stats (--profile / profile_enabled)
+# ---------------------------------------------------------------------------
+class _StageStats:
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc_net = 0
+        self.alloc_peak = 0
+
+
+class _StageTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self)
+        return False
+
+
+class StageProfiler:
+    """Wraps pipeline stages with cProfile + tracemalloc when enabled.
+    Disabled, stage() hands back a shared no-op context — one attribute check per call.
+    Only one cProfile profiler can run at a time, so entering a nested stage pauses
+    its parent's profiler until the nested stage exits.
+    Per-frame stages are sampled (every Nth frame); rare stages are always profiled.
+    Stats are dumped every profile_dump_seconds as .prof files plus a top-N summary.
+    """
+
+    def __init__(self):
+        import contextlib
+        self.enabled = False
+        self.log = None
+        self.process = "main"   # dump filename prefix — frame-bus processes share profile_dir
+        self._noop = contextlib.nullcontext()
+        self._stats = {}
+        self._stack = []
+        self._sampled = False
+        self._frame = 0
+        self._last_dump = time.time()
+
+    def configure(self, cfg, log):
+        """Apply profile_* settings; turns profiling on/off on a running bay."""
+        import tracemalloc
+        self.log = log
+        self.out_dir = cfg["profile_dir"]
+        self.dump_seconds = cfg["profile_dump_seconds"]
+        self.sample_every = max(int(cfg["profile_sample_every"]), 1)
+        self.top_n = cfg["profile_top_n"]
+        self.keep = cfg["profile_keep"]
+        enable = bool(cfg["profile_enabled"])
+        if enable == self.enabled:
+            return
+        if enable:
+            tracemalloc.start()
+            self._stats = {}
+            self._last_dump = time.time()
+            self.enabled = True
+            log.info("Profiling ON — dumps every %ss to %s/", self.dump_seconds, self.out_dir)
+        else:
+            self.dump()
+            self.enabled = False
+            tracemalloc.stop()
+            log.info("Profiling OFF")
+
+    def tick(self):
+        """Call once per capture loop iteration: picks sampled frames, dumps periodically."""
+        if not self.enabled:
+            return
+        self._frame += 1
+        self._sampled = self._frame % self.sample_every == 0
+        if time.time() - self._last_dump >= self.dump_seconds:
+            self.dump()
+
+    def stage(self, name, per_frame=False):
+        if not self.enabled or (per_frame and not self._sampled):
+            return self._noop
+        return _StageTimer(self, name)
+
+    def _enter(self, timer):
+        import tracemalloc
+        stats = self._stats.get(timer.name)
+        if stats is None:
+            stats = self._stats[timer.name] = _StageStats()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.stats.profile.disable()
+            parent.peak_seen = max(parent.peak_seen, tracemalloc.get_traced_memory()[1])
+        timer.stats = stats
+        timer.mem_start = tracemalloc.get_traced_memory()[0]
+        timer.peak_seen = 0
+        tracemalloc.reset_peak()
+        timer.wall_start = time.perf_counter()
+        timer.cpu_start = time.process_time()
+        self._stack.append(timer)
+        stats.profile.enable()
+
+    def _exit(self, timer):
+        import tracemalloc
+        stats = timer.stats
+        stats.profile.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        stats.calls += 1
+        stats.wall += time.perf_counter() - timer.wall_start
+        stats.cpu += time.process_time() - timer.cpu_start
+        stats.alloc_net += current - timer.mem_start
+        stats.alloc_peak = max(stats.alloc_peak, max(peak, timer.peak_seen) - timer.mem_start)
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1].stats.profile.enable()
+
+    def dump(self):
+        """Write per-stage .prof files and a summary, then start a fresh window."""
+        import io
+        import pstats
+        import tracemalloc
+        self._last_dump = time.time()
+        if not self.enabled or not self._stats or self._stack:
+            return
+        ts = f"{self.process}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            lines = [f"Profile window ending {datetime.now().isoformat()} (sampling every {self.sample_every} frames)", ""]
+            lines.append(f"{'stage':<24}{'calls':>7}{'wall ms':>11}{'avg ms':>9}{'cpu ms':>10}{'net KB':>10}{'peak KB':>10}")
+            for name, st in sorted(self._stats.items(), key=lambda kv: -kv[1].wall):
+                lines.append(
+                    f"{name:<24}{st.calls:>7}{st.wall * 1000:>11.1f}{st.wall * 1000 / max(st.calls, 1):>9.1f}"
+                    f"{st.cpu * 1000:>10.1f}{st.alloc_net / 1024:>10.1f}{st.alloc_peak / 1024:>10.1f}"
+                )
+            for name, st in sorted(self._stats.items()):
+                st.profile.dump_stats(os.path.join(self.out_dir, f"{ts}_{name}.prof"))
+                out = io.StringIO()
+                pstats.Stats(st.profile, stream=out).sort_stats("cumulative").print_stats(self.top_n)
+                lines += ["", f"=== {name}: top {self.top_n} by cumulative CPU time ===", out.getvalue().strip()]
+            lines += ["", f"=== Top {self.top_n} live allocations ==="]
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:self.top_n]:
+                lines.append(str(stat))
+            with open(os.path.join(self.out_dir, f"{ts}_summary.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self.log.info("Profile dump written: %s/%s_summary.txt", self.out_dir, ts)
+            self._rotate()
+        except Exception as e:
+            self.log.error("Profile dump failed: %s", e)
+        self._stats = {}
+
+    def _rotate(self):
+        """Keep only this process's newest profile_keep dumps."""
+        stamps = sorted({
+            f.split("_summary")[0] for f in os.listdir(self.out_dir)
+            if f.startswith(self.process + "_") and f.endswith("_summary.txt")
+        })
+        for old in stamps[:-self.keep] if self.keep > 0 else []:
+            for f in os.listdir(self.out_dir):
+                if f.startswith(old + "_"):
+                    try:
+                        os.remove(os.path.join(self.out_dir, f))
+                    except OSError:
+                        pass
+
+
+_profiler = StageProfiler()
+
 # ---------------------------------------------------------------------------
 # Region crop helper
 # ---------------------------------------------------------------------------
@@ -80,6 +580,46 @@ def crop_region(frame, region):
     return frame[y1:y2, x1:x2]
 
 
+class FrameGeometry:
+    """Pixel geometry for the configured regions and prefilter profiles.
+    Recomputed only when the frame resolution or the config changes, so the
+    per-frame hot path does no ratio → pixel math.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self._shape = None
+        self.boxes = {}
+        self.prefilter = ColorPrefilter(cfg["prefilter_profiles"], cfg["prefilter_patch"])
+
+    def reset(self, cfg):
+        self.cfg = cfg
+        self._shape = None
+        self.prefilter = ColorPrefilter(cfg["prefilter_profiles"], cfg["prefilter_patch"])
+
+    def update(self, frame):
+        shape = frame.shape[:2]
+        if shape == self._shape:
+            return self
+        h, w = shape
+        self.boxes = {
+            key: (
+                int(self.cfg[key]["x"] * w),
+                int(self.cfg[key]["y"] * h),
+                int((self.cfg[key]["x"] + self.cfg[key]["w"]) * w),
+                int((self.cfg[key]["y"] + self.cfg[key]["h"]) * h),
+            )
+            for key in REGION_KEYS
+        }
+        self.prefilter.compile(shape)
+        self._shape = shape
+        return self
+
+    def crop(self, frame, key):
+        x1, y1, x2, y2 = self.update(frame).boxes[key]
+        return frame[y1:y2, x1:x2]
+
+
 def ocr_read(ocr_engine, image, detail=False, log=None):
     """Unified OCR interface for PaddleOCR.
     image: numpy array (H, W, C)
@@ -90,13 +630,17 @@ def ocr_read(ocr_engine, image, detail=False, log=None):
         results = ocr_engine.predict(image)
     except Exception as e:
         if log:
-            log.debug(f"OCR predict exception: {e}")
+            log.debug("OCR predict exception: %s", e)
         return [] if not detail else []
 
-    if log:
-        log.debug(f"OCR raw result type: {type(results)}, len: {len(results) if hasattr(results, '__len__') else 'N/A'}")
+    verbose = log is not None and log.isEnabledFor(logging.DEBUG)
+    if verbose:
+        log.debug("OCR raw result type: %s, len: %s", type(results),
+                  len(results) if hasattr(results, '__len__') else 'N/A')
         for i, item in enumerate(results):
-            log.debug(f"  item[{i}] type={type(item).__name__}, keys={list(item.keys()) if isinstance(item, dict) else 'N/A'}, attrs={[a for a in dir(item) if a.startswith('rec_')]}")
+            log.debug("  item[%s] type=%s, keys=%s, attrs=%s", i, type(item).__name__,
+                      list(item.keys()) if isinstance(item, dict) else 'N/A',
+                      [a for a in dir(item) if a.startswith('rec_')])
 
     texts, scores, polys = [], [], []
     for item in results:
@@ -109,8 +653,8 @@ def ocr_read(ocr_engine, image, detail=False, log=None):
             scores = item.rec_scores
             polys = getattr(item, "rec_polys", [])
 
-    if log:
-        log.debug(f"OCR parsed texts: {texts}")
+    if verbose:
+        log.debug("OCR parsed texts: %s", texts)
 
     if not detail:
         return texts
@@ -127,8 +671,13 @@ def ocr_read(ocr_engine, image, detail=False, log=None):
 # Color pre-filter: fast scorecard screen detection (~0ms)
 # ---------------------------------------------------------------------------
 # The scorecard has a distinctive dark gray background (≈45,48,55) in areas
-# where game screens would show course content. Checking 5 pixel samples is
-# nearly instant and avoids running OCR on every frame.
+# where game screens would show course content. Checking a handful of small
+# patches is nearly instant and avoids running OCR on every frame.
+#
+# Each named profile (scorecard variants, Stableford view, other themes) is a
+# set of sample points with expected colors and tolerances. All profiles are
+# compiled into one set of pixel indices per resolution and tested with a
+# single numpy gather + compare, so extra profiles cost microseconds.
 _PREFILTER_POINTS = [
     (0.50, 0.13),  # above "SCORE CARD" text, center
     (0.30, 0.13),  # above "SCORE CARD" text, left
@@ -139,21 +688,232 @@ _PREFILTER_POINTS = [
 _DARK_GRAY = (45, 48, 55)
 _GRAY_TOLERANCE = 12
 
+_DEFAULT_PREFILTER_PROFILE = {
+    "points": [list(p) for p in _PREFILTER_POINTS],
+    "color": list(_DARK_GRAY),
+    "tolerance": _GRAY_TOLERANCE,
+    "min_matches": 4,
+}
+
+
+class ColorPrefilter:
+    """Vectorized multi-profile color test.
+    A profile is {"points": [[x, y], ...] (screen ratios),
+                  "color": [r, g, b] or "colors": one [r, g, b] per point,
+                  "tolerance": n or "tolerances": one per point (per channel),
+                  "min_matches": how many points must match (default: all but one)}.
+    """
+
+    def __init__(self, profiles, patch=3):
+        self.names = list(profiles)
+        self.profiles = [self.normalize_profile(profiles[name]) for name in self.names]
+        self.patch = patch
+        self._shape = None
+
+    @staticmethod
+    def normalize_profile(profile):
+        """Expand shorthand keys; raises ValueError/KeyError/TypeError if malformed."""
+        def number(v):
+            return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+        points = profile["points"]
+        if not isinstance(points, list) or not points:
+            raise ValueError("points must be a non-empty list of [x, y] ratios")
+        for p in points:
+            if not isinstance(p, list) or len(p) != 2 or not all(number(v) and 0 <= v < 1 for v in p):
+                raise ValueError("points must be [x, y] ratios (0.0 - 1.0)")
+        n = len(points)
+        colors = profile["colors"] if "colors" in profile else [profile["color"]] * n
+        tolerances = profile["tolerances"] if "tolerances" in profile else [profile["tolerance"]] * n
+        if not isinstance(colors, list) or len(colors) != n or not all(
+            isinstance(c, list) and len(c) == 3 and all(number(v) and 0 <= v <= 255 for v in c)
+            for c in colors
+        ):
+            raise ValueError("colors must give one [r, g, b] (0 - 255) per point")
+        if not isinstance(tolerances, list) or len(tolerances) != n or not all(
+            number(t) and t >= 0 for t in tolerances
+        ):
+            raise ValueError("tolerances must give one non-negative number per point")
+        min_matches = profile.get("min_matches", max(n - 1, 1))
+        if isinstance(min_matches, bool) or not isinstance(min_matches, int) or not 1 <= min_matches <= n:
+            raise ValueError("min_matches must be between 1 and the number of points")
+        return {"points": points, "colors": colors, "tolerances": tolerances, "min_matches": min_matches}
+
+    def compile(self, shape):
+        """Precompute patch pixel indices for a frame resolution."""
+        import numpy as np
+        if shape == self._shape:
+            return self
+        h, w = shape[:2]
+        points = np.array([p for prof in self.profiles for p in prof["points"]], dtype=np.float64)
+        r = self.patch // 2
+        offsets = np.arange(-r, r + 1)
+        dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+        ys = (points[:, 1] * h).astype(np.intp)[:, None] + dy.ravel()[None, :]
+        xs = (points[:, 0] * w).astype(np.intp)[:, None] + dx.ravel()[None, :]
+        self._ys = np.clip(ys, 0, h - 1)
+        self._xs = np.clip(xs, 0, w - 1)
+        self._colors = np.array([c for prof in self.profiles for c in prof["colors"]], dtype=np.float32)
+        self._tolerances = np.array(
+            [t for prof in self.profiles for t in prof["tolerances"]], dtype=np.float32
+        )[:, None]
+        sizes = [len(prof["points"]) for prof in self.profiles]
+        self._starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+        self._min_matches = np.array([prof["min_matches"] for prof in self.profiles])
+        self._shape = shape
+        return self
+
+    def point_matches(self, frame):
+        """Boolean match per sample point (all profiles, concatenated)."""
+        import numpy as np
+        self.compile(frame.shape[:2])
+        patches = frame[self._ys, self._xs, :3].astype(np.float32)   # (points, patch², 3)
+        means = patches.mean(axis=1)
+        return (np.abs(means - self._colors) <= self._tolerances).all(axis=1)
+
+    def counts(self, frame):
+        """Number of matching points per profile."""
+        import numpy as np
+        return np.add.reduceat(self.point_matches(frame).astype(np.int32), self._starts)
+
+    def match(self, frame):
+        """Name of the first profile that matches the frame, or None."""
+        hits = self.counts(frame) >= self._min_matches
+        for i, hit in enumerate(hits):
+            if hit:
+                return self.names[i]
+        return None
+
 
-def scorecard_color_check(frame):
+def scorecard_color_check(frame, prefilter=None):
     """Fast check: does the frame look like a scorecard based on background color?
-    Returns True if 4+ of 5 sample points match the scorecard's dark gray.
+    prefilter: compiled ColorPrefilter (FrameGeometry.prefilter); defaults to the
+               built-in scorecard profile.
+    Returns the name of the matching profile (truthy), or None.
     """
-    h, w = frame.shape[:2]
-    matches = 0
-    for x_pct, y_pct in _PREFILTER_POINTS:
-        x, y = int(x_pct * w), int(y_pct * h)
-        r, g, b = int(frame[y, x, 0]), int(frame[y, x, 1]), int(frame[y, x, 2])
-        if (abs(r - _DARK_GRAY[0]) <= _GRAY_TOLERANCE and
-                abs(g - _DARK_GRAY[1]) <= _GRAY_TOLERANCE and
-                abs(b - _DARK_GRAY[2]) <= _GRAY_TOLERANCE):
-            matches += 1
-    return matches >= 4
+    if prefilter is None:
+        prefilter = ColorPrefilter({"scorecard": _DEFAULT_PREFILTER_PROFILE})
+    return prefilter.match(frame)
+
+
+def _load_labeled_frames(folder):
+    """Load every image in folder as an RGB numpy array."""
+    import numpy as np
+    from PIL import Image
+    frames = []
+    if not os.path.isdir(folder):
+        return frames
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")):
+            with Image.open(os.path.join(folder, name)) as img:
+                frames.append((name, np.array(img.convert("RGB"))))
+    return frames
+
+
+def evaluate_prefilter(prefilter, positives, negatives):
+    """Run a ColorPrefilter over labeled frames.
+    Returns dict with false negatives/positives (file names) and their rates.
+    """
+    fn = [name for name, frame in positives if not prefilter.match(frame)]
+    fp = [name for name, frame in negatives if prefilter.match(frame)]
+    return {
+        "false_negatives": fn,
+        "false_positives": fp,
+        "fn_rate": len(fn) / len(positives) if positives else 0.0,
+        "fp_rate": len(fp) / len(negatives) if negatives else 0.0,
+    }
+
+
+def calibrate_prefilter(positives, negatives, n_points=6, grid=(32, 18), patch=3,
+                        margin=6, max_tolerance=30, min_spacing=0.08):
+    """Derive a prefilter profile from labeled frames.
+    Every point on a grid is sampled in all frames; points whose color is stable
+    across positives (small tolerance) and rarely matched by negatives are kept,
+    spread out by at least min_spacing. Returns a profile dict.
+    """
+    import numpy as np
+    gx, gy = grid
+    candidates = [
+        [round(0.02 + 0.96 * (i + 0.5) / gx, 3), round(0.02 + 0.96 * (j + 0.5) / gy, 3)]
+        for j in range(gy) for i in range(gx)
+    ]
+    probe = ColorPrefilter(
+        {"grid": {"points": candidates, "color": [0, 0, 0], "tolerance": 0}}, patch
+    )
+
+    def sample(frame):
+        probe.compile(frame.shape[:2])
+        return frame[probe._ys, probe._xs, :3].astype(np.float32).mean(axis=1)
+
+    pos = np.stack([sample(frame) for _, frame in positives])           # (frames, points, 3)
+    colors = np.median(pos, axis=0)
+    spread = np.abs(pos - colors).max(axis=(0, 2))
+    tolerances = np.ceil(spread + margin)
+    if negatives:
+        neg = np.stack([sample(frame) for _, frame in negatives])
+        neg_hits = (np.abs(neg - colors) <= tolerances[None, :, None]).all(axis=2).mean(axis=0)
+    else:
+        neg_hits = np.zeros(len(candidates))
+
+    # Best first: fewest negative matches, then tightest tolerance
+    order = np.lexsort((tolerances, neg_hits))
+    chosen = []
+    for idx in order:
+        if tolerances[idx] > max_tolerance:
+            continue
+        x, y = candidates[idx]
+        if all(abs(x - cx) >= min_spacing or abs(y - cy) >= min_spacing
+               for cx, cy in (candidates[c] for c in chosen)):
+            chosen.append(idx)
+        if len(chosen) == n_points:
+            break
+    if not chosen:
+        raise ValueError("no stable sample points found — are the positive frames the same screen?")
+    return {
+        "points": [candidates[i] for i in chosen],
+        "colors": [[int(round(v)) for v in colors[i]] for i in chosen],
+        "tolerances": [int(tolerances[i]) for i in chosen],
+        "min_matches": max(len(chosen) - 1, 1),
+    }
+
+
+def run_calibration(cfg, args):
+    """CLI: derive a prefilter profile from labeled frames and report FP/FN rates.
+    Expects <dir>/positive/ (frames showing the screen) and <dir>/negative/ (anything else).
+    """
+    positives = _load_labeled_frames(os.path.join(args.calibrate, "positive"))
+    negatives = _load_labeled_frames(os.path.join(args.calibrate, "negative"))
+    print(f"Loaded {len(positives)} positive and {len(negatives)} negative frames from {args.calibrate}/")
+    if not positives:
+        print("ERROR: need at least one frame in positive/")
+        sys.exit(1)
+
+    current = ColorPrefilter(cfg["prefilter_profiles"], cfg["prefilter_patch"])
+    report = evaluate_prefilter(current, positives, negatives)
+    print(f"Current profiles ({', '.join(current.names)}): "
+          f"FN {report['fn_rate']:.1%}, FP {report['fp_rate']:.1%}")
+
+    profile = calibrate_prefilter(positives, negatives, n_points=args.points,
+                                  patch=cfg["prefilter_patch"])
+    calibrated = ColorPrefilter({args.name: profile}, cfg["prefilter_patch"])
+    report = evaluate_prefilter(calibrated, positives, negatives)
+    print(f"Calibrated profile '{args.name}': FN {report['fn_rate']:.1%}, FP {report['fp_rate']:.1%}")
+    for name in report["false_negatives"]:
+        print(f"  missed positive:  {name}")
+    for name in report["false_positives"]:
+        print(f"  false positive:   {name}")
+
+    frame = positives[0][1]
+    calibrated.match(frame)
+    started = time.perf_counter()
+    for _ in range(1000):
+        calibrated.match(frame)
+    print(f"Cost: {(time.perf_counter() - started) * 1000:.1f}µs per frame")
+
+    print()
+    print('Add to "prefilter_profiles" in config.json:')
+    fields = [f'    "{key}": {json.dumps(value)}' for key, value in profile.items()]
+    print(f'  "{args.name}": {{\n' + ",\n".join(fields) + "\n  }")
 
 
 NAME_SKIP_WORDS = {
@@ -198,12 +958,19 @@ def detect_stableford_icons(frame):
     return False
 
 
-def parse_name_candidates(name_results, strip_icon=False, crop_height=None):
+def bbox_geometry(bbox):
+    """(x_center, y_center, height) of a 4-point OCR bbox, in the bbox's pixel space."""
+    xs = [pt[0] for pt in bbox]
+    ys = [pt[1] for pt in bbox]
+    return sum(xs) / len(xs), sum(ys) / len(ys), max(ys) - min(ys)
+
+
+def parse_name_candidates(name_results, strip_icon=False):
     """Parse name candidates from EasyOCR detail results.
     name_results: list of (bbox, text, confidence) tuples from readtext(detail=1)
     strip_icon: if True, remove leading I/S/s/5 artifacts from Stableford icon OCR
-    crop_height: if provided, compute row_index (0-based) for each name based on y-position
-    Returns list of (cleaned_name, confidence, row_index) tuples sorted by row.
+    Returns list of (cleaned_name, confidence, (x, y, height)) tuples sorted top to
+    bottom — position is the bbox center/height in crop pixels, for row alignment.
     """
     names = []
     seen = set()
@@ -230,26 +997,18 @@ def parse_name_candidates(name_results, strip_icon=False, crop_height=None):
         if not is_name_like(cleaned):
             continue
 
-        # Compute row index from bbox y-center
-        row_idx = 0
-        if crop_height and crop_height > 0:
-            # bbox = [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]
-            y_center = sum(pt[1] for pt in bbox) / len(bbox)
-            row_height = crop_height / 4.0
-            row_idx = min(int(y_center / row_height), 3)
-
         if cleaned not in seen:
-            names.append((cleaned, round(conf, 3), row_idx))
+            names.append((cleaned, round(conf, 3), bbox_geometry(bbox)))
             seen.add(cleaned)
 
-    names.sort(key=lambda x: x[2])
+    names.sort(key=lambda x: x[2][1])
     return names
 
 
 def parse_score_candidates(score_results):
     """Parse score candidates from EasyOCR detail results.
     score_results: list of (bbox, text, confidence) tuples from readtext(detail=1)
-    Returns list of (score_int, confidence) tuples — one per player row.
+    Returns list of (score_int, confidence, (x, y, height)) tuples, one per score line.
     """
     scores = []
 
@@ -274,18 +1033,186 @@ def parse_score_candidates(score_results):
             best = max(preferred)
         else:
             best = max(line_scores)
-        scores.append((best, round(conf, 3)))
+        scores.append((best, round(conf, 3), bbox_geometry(bbox)))
 
     return scores
 
+
+# ---------------------------------------------------------------------------
+# Row alignment: pair names with scores by position, not list order
+# ---------------------------------------------------------------------------
+# Both columns are mapped into screen coordinates. Row bands come from the name
+# column (clustering name y-centers, so any number of players and uneven row
+# heights work), extended along the row pitch to cover name_region so a row
+# whose name OCR missed still has a slot; or, with table_rows set, from
+# splitting name_region evenly. Scores are then assigned to the nearest band.
+# A dropped or extra line only affects its own row instead of shifting every
+# player.
+def to_screen(geometry, crop_shape, region):
+    """Map (x, y, height) from crop pixels to screen ratios for a region."""
+    x, y, height = geometry
+    crop_h, crop_w = crop_shape[:2]
+    return (
+        region["x"] + x / max(crop_w, 1) * region["w"],
+        region["y"] + y / max(crop_h, 1) * region["h"],
+        height / max(crop_h, 1) * region["h"],
+    )
+
+
+def _cluster_rows(ys, heights, gap_factor=0.6, merge_factor=0.5):
+    """Cluster y-centers into rows. Returns (sorted centers, median text height).
+    A new row starts wherever consecutive y-centers are further apart than
+    gap_factor × the median text height; clusters closer together than
+    merge_factor × the median row pitch are then merged back into one row.
+    """
+    import numpy as np
+    ys = np.sort(np.asarray(ys, dtype=np.float64))
+    positive = np.asarray(heights, dtype=np.float64)
+    positive = positive[positive > 0]
+    text_height = float(np.median(positive)) if positive.size else 0.02
+    if ys.size == 0:
+        return np.empty(0), text_height
+    labels = np.concatenate(([0], np.cumsum(np.diff(ys) > gap_factor * text_height)))
+    centers = np.bincount(labels, weights=ys) / np.bincount(labels)
+    if centers.size >= 3:
+        pitch = np.diff(centers)
+        merged = np.concatenate(([0], np.cumsum(pitch >= merge_factor * np.median(pitch))))
+        labels = merged[labels]
+        centers = np.bincount(labels, weights=ys) / np.bincount(labels)
+    return centers, text_height
+
+
+def row_bands(names, scores, region=None):
+    """Row bands for name and score geometries ((x, y, height) in screen ratios).
+    Rows are anchored on the name clusters (the score clusters if no name was
+    read). The row pitch — median spacing of both columns' clusters — fills
+    gaps left by missed rows and, with region given, extends the bands to every
+    row slot inside it. Returns (centers, half_heights).
+    """
+    import numpy as np
+    name_centers, name_height = _cluster_rows([g[1] for g in names], [g[2] for g in names])
+    score_centers, score_height = _cluster_rows([g[1] for g in scores], [g[2] for g in scores])
+    anchors, text_height = (
+        (name_centers, name_height) if name_centers.size else (score_centers, score_height)
+    )
+    if anchors.size == 0:
+        return np.empty(0), np.empty(0)
+    pitches = np.concatenate((np.diff(name_centers), np.diff(score_centers)))
+    if region is None or pitches.size == 0:
+        return anchors, _half_heights(anchors, text_height)
+    pitch = float(np.median(pitches))
+
+    centers = [anchors[0]]
+    for nxt in anchors[1:]:
+        gap = nxt - centers[-1]
+        slots = max(int(round(gap / pitch)), 1)
+        centers += [centers[-1] + gap * k / slots for k in range(1, slots)] + [nxt]
+    top, bottom = region["y"], region["y"] + region["h"]
+    while centers[0] - pitch >= top:
+        centers.insert(0, centers[0] - pitch)
+    while centers[-1] + pitch <= bottom:
+        centers.append(centers[-1] + pitch)
+    centers = np.array(centers)
+    return centers, _half_heights(centers, text_height)
+
+
+def fixed_row_bands(region, rows):
+    """Evenly split a region into `rows` bands. Returns (centers, half_heights)."""
+    import numpy as np
+    pitch = region["h"] / rows
+    centers = region["y"] + pitch * (np.arange(rows) + 0.5)
+    return centers, np.full(rows, pitch / 2)
+
+
+def _half_heights(centers, text_height):
+    """Half the distance to the nearest neighbour band (edge bands mirror their neighbour).
+    A lone row has no neighbour, so it spans 1.5 × text height either side.
+    """
+    import numpy as np
+    if centers.size == 1:
+        return np.full(1, 1.5 * text_height)
+    pitch = np.diff(centers)
+    nearest = np.minimum(np.concatenate(([pitch[0]], pitch)), np.concatenate((pitch, [pitch[-1]])))
+    return nearest / 2
+
+
+def assign_rows(positions, centers, half_heights):
+    """Vectorized nearest-band assignment.
+    positions: detection y-centers (screen ratios). Returns (band index, alignment
+    confidence) arrays — confidence is 1.0 at the band center, 0.0 at its edge or beyond.
+    """
+    import numpy as np
+    ys = np.asarray(positions, dtype=np.float64)
+    if ys.size == 0 or centers.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    dist = np.abs(ys[:, None] - centers[None, :])
+    rows = dist.argmin(axis=1)
+    closest = dist[np.arange(ys.size), rows]
+    return rows, np.clip(1.0 - closest / half_heights[rows], 0.0, 1.0)
+
+
+def align_rows(names, scores, bands=None, region=None):
+    """Pair names and scores that sit on the same table row.
+    names:  list of (name, confidence, (x, y, height)) in screen ratios
+    scores: list of (score, confidence, (x, y, height)) in screen ratios
+    bands:  optional (centers, half_heights); built by row_bands() if None
+    region: table region the auto bands are extended to cover (name_region)
+    Returns (rows, dropped). rows has one dict per occupied row, top to bottom:
+    row, name (None if not read), name_confidence, score, score_confidence,
+    alignment_confidence (worst of the row's name/score fits; 0.0 when either
+    column is missing). dropped lists the scores outside every band.
+    """
+    if bands is None:
+        bands = row_bands([g for _, _, g in names], [g for _, _, g in scores], region)
+    centers, half_heights = bands
+    name_rows, name_fit = assign_rows([g[1] for _, _, g in names], centers, half_heights)
+    score_rows, score_fit = assign_rows([g[1] for _, _, g in scores], centers, half_heights)
+
+    rows = {}
+    # Names on the same row are OCR splits (e.g. "b" + "mollon") — merge left to right
+    for (name, conf, geom), row, fit in sorted(
+        zip(names, name_rows, name_fit), key=lambda item: item[0][2][0]
+    ):
+        entry = rows.setdefault(int(row), {})
+        if "name" in entry:
+            entry["name"] = f"{entry['name']} {name}"
+            entry["name_confidence"] = min(entry["name_confidence"], conf)
+            entry["name_fit"] = min(entry["name_fit"], float(fit))
+        else:
+            entry.update(name=name, name_confidence=conf, name_fit=float(fit))
+    # Several score lines on one row — keep the best-centered one
+    dropped = []
+    for (score, conf, geom), row, fit in zip(scores, score_rows, score_fit):
+        if fit <= 0:
+            dropped.append(score)
+            continue
+        entry = rows.setdefault(int(row), {})
+        if "score" not in entry or fit > entry["score_fit"]:
+            entry.update(score=score, score_confidence=conf, score_fit=float(fit))
+
+    aligned = []
+    for row in sorted(rows):
+        entry = rows[row]
+        aligned.append({
+            "row": row,
+            "name": entry.get("name"),
+            "name_confidence": entry.get("name_confidence", 0.0),
+            "score": entry.get("score"),
+            "score_confidence": entry.get("score_confidence", 0.0),
+            "alignment_confidence": round(min(entry.get("name_fit", 0.0), entry.get("score_fit", 0.0)), 3),
+        })
+    return aligned, dropped
+
 # ---------------------------------------------------------------------------
 # Stage 1A: Scorecard screen detection
 # ---------------------------------------------------------------------------
-def detect_scorecard(frame, ocr_engine, region, log, save_debug=False, debug_dir="captures"):
+def detect_scorecard(frame, ocr_engine, region, log, save_debug=False, debug_dir="captures",
+                     geometry=None):
     """Check if 'SCORE CARD' text is visible in the detection region.
+    geometry: optional FrameGeometry — uses its cached detect_region box instead of region.
     Returns (detected: bool, text: str) — text is the raw OCR for course fallback.
     """
-    cropped = crop_region(frame, region)
+    cropped = geometry.crop(frame, "detect_region") if geometry else crop_region(frame, region)
 
     # Save debug crop AND full frame on first few color-triggered calls
     if save_debug:
@@ -299,18 +1226,18 @@ def detect_scorecard(frame, ocr_engine, region, log, save_debug=False, debug_dir
             # Save full frame
             full_path = os.path.join(debug_dir, f"debug_full_{ts}.png")
             Image.fromarray(frame).save(full_path)
-            log.debug(f"Saved debug images: {debug_path} and {full_path}")
+            log.debug("Saved debug images: %s and %s", debug_path, full_path)
         except Exception as e:
-            log.debug(f"Could not save debug crop: {e}")
+            log.debug("Could not save debug crop: %s", e)
 
     try:
         texts = ocr_read(ocr_engine, cropped, detail=False, log=log)
         text = " ".join(texts).upper()
-        log.debug(f"Detection OCR text: {text}")
+        log.debug("Detection OCR text: %s", text)
         if "SCORE CARD" in text or "SCORE  CARD" in text:
             return True, text
     except Exception as e:
-        log.error(f"Detection OCR error: {e}")
+        log.error("Detection OCR error: %s", e)
     return False, ""
 
 # ---------------------------------------------------------------------------
@@ -322,45 +1249,53 @@ def detect_game_complete(frame, ocr_engine, region, log):
     try:
         texts = ocr_read(ocr_engine, cropped, detail=False)
         text = " ".join(texts).upper()
-        log.debug(f"Completion check OCR text: {text}")
+        log.debug("Completion check OCR text: %s", text)
         if "STROKE" in text or "STABLEFORD" in text or "PERIO" in text:
             log.info("Game completion confirmed (STROKE/STABLEFORD buttons found)")
             return True
     except Exception as e:
-        log.error(f"Completion detection OCR error: {e}")
+        log.error("Completion detection OCR error: %s", e)
     return False
 
 # ---------------------------------------------------------------------------
 # Stage 2: Score extraction (full OCR)
 # ---------------------------------------------------------------------------
-def extract_scores(frame, ocr_engine, cfg, log, detection_text=""):
-    """Extract player names, total scores, and confidence from scorecard."""
+def extract_scores(frame, ocr_engine, cfg, log, detection_text="", geometry=None):
+    """Extract player names, total scores, and confidence from scorecard.
+    geometry: optional FrameGeometry with cached pixel boxes for cfg's regions.
+    """
     from PIL import Image
     import numpy as np
     results = {"course": "", "players": []}
 
+    def crop(key):
+        return geometry.crop(frame, key) if geometry else crop_region(frame, cfg[key])
+
     # OCR the name region — upscale 5x for better small-text detection
-    name_crop = crop_region(frame, cfg["name_region"])
+    name_crop = crop("name_region")
     try:
-        pil_crop = Image.fromarray(name_crop)
-        upscaled = pil_crop.resize(
-            (pil_crop.width * 5, pil_crop.height * 5), Image.LANCZOS
-        )
-        name_input = np.array(upscaled)
-        name_results = ocr_read(ocr_engine, name_input, detail=True)
-        log.info(f"Name region raw OCR: {[(t, round(c, 3)) for _, t, c in name_results]}")
+        with _profiler.stage("extract.name_resize"):
+            pil_crop = Image.fromarray(name_crop)
+            upscaled = pil_crop.resize(
+                (pil_crop.width * 5, pil_crop.height * 5), Image.LANCZOS
+            )
+            name_input = np.array(upscaled)
+        with _profiler.stage("extract.name_ocr"):
+            name_results = ocr_read(ocr_engine, name_input, detail=True)
+        log.info("Name region raw OCR: %s", [(t, round(c, 3)) for _, t, c in name_results])
     except Exception as e:
-        log.error(f"Name OCR error: {e}")
+        log.error("Name OCR error: %s", e)
         name_results = []
         name_input = name_crop
 
     # OCR the score region
-    score_crop = crop_region(frame, cfg["score_region"])
+    score_crop = crop("score_region")
     try:
-        score_results = ocr_read(ocr_engine, score_crop, detail=True)
-        log.info(f"Score region raw OCR: {[(t, round(c, 3)) for _, t, c in score_results]}")
+        with _profiler.stage("extract.score_ocr"):
+            score_results = ocr_read(ocr_engine, score_crop, detail=True)
+        log.info("Score region raw OCR: %s", [(t, round(c, 3)) for _, t, c in score_results])
     except Exception as e:
-        log.error(f"Score OCR error: {e}")
+        log.error("Score OCR error: %s", e)
         score_results = []
 
     # Detect Stableford icons to decide whether to strip S artifacts from names
@@ -368,52 +1303,56 @@ def extract_scores(frame, ocr_engine, cfg, log, detection_text=""):
     if has_icons:
         log.info("Stableford icons detected — will strip S/I artifacts from names")
 
-    names = parse_name_candidates(
-        name_results, strip_icon=has_icons,
-        crop_height=name_input.shape[0] if len(name_results) > 0 else None,
-    )
-    scores = parse_score_candidates(score_results)
-    log.info(f"Parsed name candidates: {names}")
-    log.info(f"Parsed score candidates: {scores}")
-
-    # Build a row_index → name mapping for positional alignment
-    # Merge multiple names in the same row (e.g. "b" + "mollon" → "b mollon")
-    name_by_row = {}
-    for entry in names:
-        name, conf, row_idx = entry
-        if row_idx in name_by_row:
-            prev_name, prev_conf = name_by_row[row_idx]
-            name_by_row[row_idx] = (f"{prev_name} {name}", min(prev_conf, conf))
-        else:
-            name_by_row[row_idx] = (name, conf)
-
-    # Pair scores with names using row alignment
-    for i in range(len(scores)):
-        score, score_conf = scores[i]
-        if score == 0:
+    # Map both columns into screen coordinates so they share row bands
+    names = [
+        (name, conf, to_screen(geom, name_input.shape, cfg["name_region"]))
+        for name, conf, geom in parse_name_candidates(name_results, strip_icon=has_icons)
+    ]
+    scores = [
+        (score, conf, to_screen(geom, score_crop.shape, cfg["score_region"]))
+        for score, conf, geom in parse_score_candidates(score_results)
+    ]
+    log.info("Parsed name candidates: %s", [(n, c) for n, c, _ in names])
+    log.info("Parsed score candidates: %s", [(s, c) for s, c, _ in scores])
+
+    fixed_rows = cfg["table_rows"] != "auto"
+    bands = fixed_row_bands(cfg["name_region"], cfg["table_rows"]) if fixed_rows else None
+    rows, dropped = align_rows(names, scores, bands=bands, region=cfg["name_region"])
+    log.info("Aligned rows: %s", [
+        (r["row"], r["name"], r["score"], r["alignment_confidence"]) for r in rows
+    ])
+    for score in dropped:
+        log.warning("Dropping score %s outside the table rows", score)
+
+    # Fixed rows: the seat is the table row. Auto bands may include empty slots
+    # where name_region has slack above the first row, so seats count occupied
+    # rows instead. A score whose name was not read becomes "Player N"; a named
+    # row without a score keeps its seat.
+    seat = 0
+    for row in rows:
+        seat = row["row"] + 1 if fixed_rows else seat + 1
+        if not row["score"]:
             continue
-        if i in name_by_row:
-            name, name_conf = name_by_row[i]
-        else:
-            name, name_conf = f"Player {i + 1}", 0.0
         results["players"].append({
-            "seat_index": i + 1,
-            "name": name,
-            "total_score": score,
-            "name_confidence": name_conf,
-            "score_confidence": score_conf,
+            "seat_index": seat,
+            "name": row["name"] or f"Player {seat}",
+            "total_score": row["score"],
+            "name_confidence": row["name_confidence"],
+            "score_confidence": row["score_confidence"],
+            "alignment_confidence": row["alignment_confidence"],
         })
 
     # Course name — try OCR first, fall back to detection text
     try:
-        course_crop = crop_region(frame, cfg["course_region"])
-        course_texts = ocr_read(ocr_engine, course_crop, detail=False)
+        course_crop = crop("course_region")
+        with _profiler.stage("extract.course_ocr"):
+            course_texts = ocr_read(ocr_engine, course_crop, detail=False)
         course_text = " ".join(course_texts)
         if course_text:
             results["course"] = course_text
-            log.info(f"Course name raw OCR: {course_text}")
+            log.info("Course name raw OCR: %s", course_text)
     except Exception as e:
-        log.debug(f"Course OCR error: {e}")
+        log.debug("Course OCR error: %s", e)
 
     # Fallback: extract course from detection text (e.g. "MAUNA OCEAN C.C SCORE CARD")
     if not results["course"] and detection_text:
@@ -422,7 +1361,7 @@ def extract_scores(frame, ocr_engine, cfg, log, detection_text=""):
             idx = dt.find(marker)
             if idx > 0:
                 results["course"] = detection_text[:idx].strip()
-                log.info(f"Course from detection text: {results['course']}")
+                log.info("Course from detection text: %s", results['course'])
                 break
 
     return results
@@ -441,18 +1380,392 @@ def save_screenshot(frame, save_dir, prefix="scorecard"):
     return path
 
 
+# ---------------------------------------------------------------------------
+# Capture archive: local SQLite index + JPEG files, with retention
+# ---------------------------------------------------------------------------
+# Every confirmed scorecard is appended here (results JSON + screenshot path),
+# indexed by time, bay, course and player name, so staff can look up a game
+# without touching Google Drive. Rows are only ever inserted, annotated with
+# the Drive link, or removed by retention.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    captured_at TEXT NOT NULL,
+    date TEXT NOT NULL,
+    bay INTEGER NOT NULL,
+    course TEXT NOT NULL DEFAULT '',
+    results_json TEXT NOT NULL,
+    image_path TEXT,
+    image_bytes INTEGER NOT NULL DEFAULT 0,
+    screenshot_url TEXT
+);
+CREATE TABLE IF NOT EXISTS players (
+    capture_id INTEGER NOT NULL REFERENCES captures(id) ON DELETE CASCADE,
+    seat_index INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    total_score INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_captures_bay_date ON captures(bay, date);
+CREATE INDEX IF NOT EXISTS idx_captures_date ON captures(date);
+CREATE INDEX IF NOT EXISTS idx_captures_captured_at ON captures(captured_at);
+CREATE INDEX IF NOT EXISTS idx_captures_course ON captures(course COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_players_name ON players(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_players_capture ON players(capture_id);
+"""
+
+
+class CaptureArchive:
+    def __init__(self, archive_dir, log=None):
+        import sqlite3
+        self.dir = archive_dir
+        self.log = log
+        os.makedirs(archive_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(archive_dir, "archive.db"))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(ARCHIVE_SCHEMA)
+
+    def add(self, frame, results, bay_number, jpeg_quality=85):
+        """Store the scorecard frame as JPEG and index its results.
+        Returns (capture_id, image_path).
+        """
+        from PIL import Image
+        now = datetime.now()
+        day_dir = os.path.join(self.dir, now.strftime("%Y-%m-%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        image_path = os.path.join(day_dir, f"bay{bay_number}_{now.strftime('%H%M%S')}.jpg")
+        Image.fromarray(frame).convert("RGB").save(image_path, format="JPEG", quality=jpeg_quality)
+        entry = {
+            "timestamp": now.isoformat(),
+            "bay_number": bay_number,
+            "source_version": SCRIPT_VERSION,
+            "course": results.get("course", ""),
+            "players": results.get("players", []),
+        }
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO captures (captured_at, date, bay, course, results_json, image_path, image_bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (now.isoformat(timespec="seconds"), now.strftime("%Y-%m-%d"), bay_number,
+                 entry["course"], json.dumps(entry, ensure_ascii=False),
+                 image_path, os.path.getsize(image_path)),
+            )
+            self.db.executemany(
+                "INSERT INTO players (capture_id, seat_index, name, total_score) VALUES (?, ?, ?, ?)",
+                [(cur.lastrowid, p.get("seat_index"), p.get("name", ""), p.get("total_score"))
+                 for p in entry["players"]],
+            )
+        return cur.lastrowid, image_path
+
+    def set_screenshot_url(self, capture_id, url):
+        with self.db:
+            self.db.execute("UPDATE captures SET screenshot_url = ? WHERE id = ?", (url, capture_id))
+
+    def enforce_retention(self, max_days, max_mb):
+        """Delete captures older than max_days, then oldest-first until images fit in max_mb."""
+        doomed = []
+        if max_days and max_days > 0:
+            cutoff = datetime.fromtimestamp(time.time() - max_days * 86400).isoformat(timespec="seconds")
+            doomed += self.db.execute(
+                "SELECT id, image_path, image_bytes FROM captures WHERE captured_at < ?", (cutoff,)
+            ).fetchall()
+        if max_mb and max_mb > 0:
+            budget = max_mb * 1024 * 1024
+            total = self.db.execute("SELECT COALESCE(SUM(image_bytes), 0) FROM captures").fetchone()[0]
+            total -= sum(row["image_bytes"] for row in doomed)
+            if total > budget:
+                skip = {row["id"] for row in doomed}
+                for row in self.db.execute("SELECT id, image_path, image_bytes FROM captures ORDER BY id"):
+                    if total <= budget:
+                        break
+                    if row["id"] in skip:
+                        continue
+                    doomed.append(row)
+                    total -= row["image_bytes"]
+        if not doomed:
+            return 0
+        with self.db:
+            self.db.executemany("DELETE FROM captures WHERE id = ?", [(row["id"],) for row in doomed])
+        for row in doomed:
+            if row["image_path"]:
+                try:
+                    os.remove(row["image_path"])
+                except OSError:
+                    pass
+        if self.log:
+            self.log.info("Archive retention removed %s capture(s)", len(doomed))
+        return len(doomed)
+
+    def query(self, bay=None, date=None, player=None, course=None, limit=100):
+        """Return matching captures (newest first) as dicts with parsed results."""
+        where, params = [], []
+        if bay is not None:
+            where.append("c.bay = ?")
+            params.append(bay)
+        if date:
+            where.append("c.date = ?")
+            params.append(date)
+        if course:
+            where.append("c.course LIKE ?")
+            params.append(f"%{course}%")
+        if player:
+            where.append("EXISTS (SELECT 1 FROM players p WHERE p.capture_id = c.id AND p.name = ?)")
+            params.append(player)
+        sql = "SELECT * FROM captures c"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY c.captured_at DESC LIMIT ?"
+        rows = self.db.execute(sql, params + [limit]).fetchall()
+        out = []
+        for row in rows:
+            item = dict(row)
+            item["results"] = json.loads(item.pop("results_json"))
+            out.append(item)
+        return out
+
+    def close(self):
+        self.db.close()
+
+
+def run_archive_query(cfg, args):
+    """CLI: print archived captures matching --bay / --date / --player / --course."""
+    if not os.path.exists(os.path.join(cfg["archive_dir"], "archive.db")):
+        print(f"No archive found in {cfg['archive_dir']}/")
+        return
+    archive = CaptureArchive(cfg["archive_dir"])
+    try:
+        rows = archive.query(bay=args.bay, date=args.date, player=args.player,
+                             course=args.course, limit=args.limit)
+    finally:
+        archive.close()
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        print("No matching captures.")
+        return
+    for row in rows:
+        players = ", ".join(
+            f"{p.get('name')} {p.get('total_score')}" for p in row["results"].get("players", [])
+        )
+        print(f"{row['captured_at'].replace('T', ' ')}  Bay {row['bay']}  {row['course'] or '-'}")
+        print(f"    Players: {players or '(none)'}")
+        print(f"    Image:   {row['image_path']}")
+        if row["screenshot_url"]:
+            print(f"    Drive:   {row['screenshot_url']}")
+    print(f"{len(rows)} capture(s)")
+
+
+# ---------------------------------------------------------------------------
+# Replay buffer: rolling JPEG history of the last N seconds
+# ---------------------------------------------------------------------------
+# Every grabbed frame is handed to a background encoder which downscales it,
+# JPEG-compresses it and appends it to an in-memory ring. The ring is trimmed
+# by age and by total encoded bytes, so memory stays capped however long the
+# bay runs. The grab loop only ever does a non-blocking queue put.
+class ReplayBuffer:
+    def __init__(self, cfg, log):
+        import queue
+        import threading
+        from collections import deque
+        self.log = log
+        self.bay_number = cfg["bay_number"]
+        self.max_seconds = float(cfg["replay_seconds"])
+        self.max_bytes = int(cfg["replay_max_mb"] * 1024 * 1024)
+        self.width = int(cfg["replay_width"])
+        self.quality = int(cfg["replay_jpeg_quality"])
+        self.out_dir = cfg["replay_dir"]
+        self.keep_clips = cfg["replay_keep_clips"]
+        self.keep_days = cfg["replay_keep_days"]
+        self.keep_bytes = cfg["replay_keep_mb"] * 1024 * 1024
+        # Raw frames waiting to be encoded. Kept tiny — if the encoder falls
+        # behind, new frames are dropped rather than queued.
+        self._inbox = queue.Queue(maxsize=2)
+        self._frames = deque()      # (timestamp, jpeg_bytes)
+        self._bytes = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._encode_loop, name="replay-encoder", daemon=True)
+        self._thread.start()
+
+    def push(self, frame):
+        """Queue a frame for encoding. Never blocks the caller."""
+        try:
+            self._inbox.put_nowait((time.time(), frame))
+        except Exception:
+            self._dropped += 1
+
+    def _encode_loop(self):
+        import io
+        import queue
+        from PIL import Image
+        while self._running:
+            try:
+                ts, frame = self._inbox.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                img = Image.fromarray(frame)
+                if img.width > self.width:
+                    img = img.resize(
+                        (self.width, int(img.height * self.width / img.width)), Image.BILINEAR
+                    )
+                buf = io.BytesIO()
+                img.convert("RGB").save(buf, format="JPEG", quality=self.quality)
+                data = buf.getvalue()
+            except Exception as e:
+                self.log.debug("Replay encode failed: %s", e)
+                continue
+            with self._lock:
+                self._frames.append((ts, data))
+                self._bytes += len(data)
+                self._trim(ts)
+
+    def _trim(self, now):
+        while self._frames and (
+            self._bytes > self.max_bytes or now - self._frames[0][0] > self.max_seconds
+        ):
+            _, old = self._frames.popleft()
+            self._bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            span = self._frames[-1][0] - self._frames[0][0] if self._frames else 0.0
+            return {
+                "frames": len(self._frames),
+                "bytes": self._bytes,
+                "seconds": round(span, 1),
+                "dropped": self._dropped,
+            }
+
+    def dump(self, reason):
+        """Write the buffered frames to a clip folder in the background.
+        Returns the folder path, or None if the buffer is empty.
+        """
+        import threading
+        with self._lock:
+            frames = list(self._frames)
+        if not frames:
+            self.log.debug("Replay dump (%s) skipped — buffer empty", reason)
+            return None
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        clip_dir = os.path.join(self.out_dir, f"bay{self.bay_number}_{ts}_{reason}")
+        threading.Thread(
+            target=self._write_clip, args=(clip_dir, frames, reason),
+            name="replay-dump", daemon=True,
+        ).start()
+        return clip_dir
+
+    def _write_clip(self, clip_dir, frames, reason):
+        try:
+            os.makedirs(clip_dir, exist_ok=True)
+            index = []
+            for i, (ts, data) in enumerate(frames):
+                name = f"{i:04d}.jpg"
+                with open(os.path.join(clip_dir, name), "wb") as f:
+                    f.write(data)
+                index.append({"file": name, "timestamp": datetime.fromtimestamp(ts).isoformat()})
+            manifest = {
+                "bay_number": self.bay_number,
+                "reason": reason,
+                "source_version": SCRIPT_VERSION,
+                "frames": index,
+            }
+            with open(os.path.join(clip_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            self.log.info("Replay clip saved (%s frames, %s): %s", len(frames), reason, clip_dir)
+        except Exception as e:
+            self.log.error("Replay dump failed: %s", e)
+        try:
+            self.enforce_retention()
+        except Exception as e:
+            self.log.error("Replay retention failed: %s", e)
+
+    def enforce_retention(self):
+        """Delete clip folders older than replay_keep_days, then oldest-first until
+        at most replay_keep_clips remain within replay_keep_mb on disk.
+        """
+        import shutil
+        clips = []
+        for entry in os.scandir(self.out_dir):
+            if not entry.is_dir() or not os.path.exists(os.path.join(entry.path, "manifest.json")):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            clips.append((entry.stat().st_mtime, entry.path, size))
+        clips.sort()   # oldest first
+
+        doomed = []
+        if self.keep_days and self.keep_days > 0:
+            cutoff = time.time() - self.keep_days * 86400
+            doomed = [clip for clip in clips if clip[0] < cutoff]
+            clips = clips[len(doomed):]
+        total = sum(size for _, _, size in clips)
+        while clips and (
+            (self.keep_clips and len(clips) > self.keep_clips)
+            or (self.keep_bytes and total > self.keep_bytes)
+        ):
+            clip = clips.pop(0)
+            doomed.append(clip)
+            total -= clip[2]
+        for _, path, _ in doomed:
+            shutil.rmtree(path, ignore_errors=True)
+        if doomed:
+            self.log.info("Replay retention removed %s clip(s)", len(doomed))
+        return len(doomed)
+
+    def close(self):
+        self._running = False
+
+
+def request_replay_dump(cfg):
+    """Ask a running capture process to dump its replay buffer (creates the trigger file)."""
+    with open(cfg["replay_trigger_file"], "w") as f:
+        f.write(datetime.now().isoformat())
+    print(f"Replay dump requested — the running capture will save a clip to {cfg['replay_dir']}/")
+
+
+# ---------------------------------------------------------------------------
+# Stuck screen detection
+# ---------------------------------------------------------------------------
+def calculate_frame_diff(frame_a, frame_b, step=10):
+    """Compare two frames. Returns 0.0 (identical) to 1.0 (completely different).
+    step: pixel stride used to downsample (1 if the frames are already downsampled).
+    """
+    import numpy as np
+    if frame_a is None or frame_b is None or frame_a.shape != frame_b.shape:
+        return 1.0
+    # Downsample for speed (compare every 10th pixel)
+    a = frame_a[::step, ::step].astype(np.float32)
+    b = frame_b[::step, ::step].astype(np.float32)
+    return float(np.mean(np.abs(a - b)) / 255.0)
+
+
 # ---------------------------------------------------------------------------
 # Google Drive upload
 # ---------------------------------------------------------------------------
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 TOKEN_FILE = "token.json"
 
+# Drive service + folder IDs are cached between uploads; cleared on config reload
+_drive_cache = {"service": None, "client_secret": None, "folders": {}}
+
+
+def reset_upload_targets():
+    """Forget cached Drive service and folder IDs (after upload settings change)."""
+    _drive_cache["service"] = None
+    _drive_cache["client_secret"] = None
+    _drive_cache["folders"] = {}
+
 
 def _get_drive_service(cfg, log):
     """Initialize Google Drive API service using OAuth2 tokens."""
     client_secret = cfg.get("google_drive_client_secret", "")
     if not client_secret or not os.path.exists(client_secret):
         return None
+    if _drive_cache["service"] and _drive_cache["client_secret"] == client_secret:
+        return _drive_cache["service"]
     if not os.path.exists(TOKEN_FILE):
         log.error("No token.json found. Run: python capture.py --auth to authenticate.")
         return None
@@ -466,9 +1779,12 @@ def _get_drive_service(cfg, log):
             creds.refresh(Request())
             with open(TOKEN_FILE, "w") as f:
                 f.write(creds.to_json())
-        return build("drive", "v3", credentials=creds)
+        service = build("drive", "v3", credentials=creds)
+        _drive_cache["service"] = service
+        _drive_cache["client_secret"] = client_secret
+        return service
     except Exception as e:
-        log.error(f"Google Drive auth failed: {e}")
+        log.error("Google Drive auth failed: %s", e)
         return None
 
 
@@ -490,6 +1806,9 @@ def run_auth_flow(cfg):
 
 def _get_or_create_folder(service, parent_id, folder_name):
     """Find a subfolder by name under parent, or create it."""
+    cached = _drive_cache["folders"].get((parent_id, folder_name))
+    if cached:
+        return cached
     query = (
         f"'{parent_id}' in parents and name='{folder_name}' "
         f"and mimeType='application/vnd.google-apps.folder' and trashed=false"
@@ -497,6 +1816,7 @@ def _get_or_create_folder(service, parent_id, folder_name):
     results = service.files().list(q=query, fields="files(id)").execute()
     files = results.get("files", [])
     if files:
+        _drive_cache["folders"][(parent_id, folder_name)] = files[0]["id"]
         return files[0]["id"]
     metadata = {
         "name": folder_name,
@@ -504,6 +1824,7 @@ def _get_or_create_folder(service, parent_id, folder_name):
         "parents": [parent_id],
     }
     folder = service.files().create(body=metadata, fields="id").execute()
+    _drive_cache["folders"][(parent_id, folder_name)] = folder["id"]
     return folder["id"]
 
 
@@ -536,9 +1857,13 @@ def upload_to_google_drive(results, screenshot_path, cfg, log):
 
         # Upload screenshot as JPEG
         if screenshot_path and os.path.exists(screenshot_path):
-            jpeg_path = screenshot_path.replace(".png", "_upload.jpg")
-            img = Image.open(screenshot_path)
-            img.convert("RGB").save(jpeg_path, format="JPEG", quality=80)
+            is_jpeg = screenshot_path.lower().endswith((".jpg", ".jpeg"))
+            if is_jpeg:
+                jpeg_path = screenshot_path  # archived JPEG — upload as-is
+            else:
+                jpeg_path = screenshot_path.replace(".png", "_upload.jpg")
+                img = Image.open(screenshot_path)
+                img.convert("RGB").save(jpeg_path, format="JPEG", quality=80)
 
             file_meta = {"name": f"{timestamp}.jpg", "parents": [date_folder_id]}
             media = MediaFileUpload(jpeg_path, mimetype="image/jpeg")
@@ -546,13 +1871,14 @@ def upload_to_google_drive(results, screenshot_path, cfg, log):
                 body=file_meta, media_body=media, fields="id,webViewLink"
             ).execute()
 
-            try:
-                os.remove(jpeg_path)
-            except OSError:
-                pass
+            if not is_jpeg:
+                try:
+                    os.remove(jpeg_path)
+                except OSError:
+                    pass
 
             screenshot_link = uploaded.get("webViewLink", "")
-            log.info(f"Screenshot uploaded to Drive: Bay {bay_num}/{today}/{timestamp}.jpg")
+            log.info("Screenshot uploaded to Drive: Bay %s/%s/%s.jpg", bay_num, today, timestamp)
 
         # Upload results JSON
         result_entry = {
@@ -569,12 +1895,13 @@ def upload_to_google_drive(results, screenshot_path, cfg, log):
         json_meta = {"name": f"{timestamp}.json", "parents": [date_folder_id]}
         json_media = MediaInMemoryUpload(json_bytes, mimetype="application/json")
         service.files().create(body=json_meta, media_body=json_media, fields="id").execute()
-        log.info(f"Results uploaded to Drive: Bay {bay_num}/{today}/{timestamp}.json")
+        log.info("Results uploaded to Drive: Bay %s/%s/%s.json", bay_num, today, timestamp)
 
         return screenshot_link
 
     except Exception as e:
-        log.error(f"Google Drive upload failed: {e}")
+        log.error("Google Drive upload failed: %s", e)
+        reset_upload_targets()  # don't reuse a possibly stale service/folder next time
         return None
 
 # ---------------------------------------------------------------------------
@@ -582,22 +1909,19 @@ def upload_to_google_drive(results, screenshot_path, cfg, log):
 # ---------------------------------------------------------------------------
 def submit_to_pos(results, screenshot_path, cfg, log):
     """Upload to Google Drive, then POST score results to POS API.
-    Returns True if Google Drive upload succeeded.
+    Returns the Drive screenshot link if the Google Drive upload succeeded, else None.
     """
     drive_link = None
-    drive_ok = False
     try:
         drive_link = upload_to_google_drive(results, screenshot_path, cfg, log)
-        if drive_link:
-            drive_ok = True
     except Exception as e:
-        log.error(f"Google Drive upload error: {e}")
+        log.error("Google Drive upload error: %s", e)
 
     # POST results to POS server
     url = cfg.get("pos_server_url", "")
     if not url:
         log.debug("No POS server URL configured, skipping server submission")
-        return drive_ok
+        return drive_link
     try:
         import requests
 
@@ -616,39 +1940,272 @@ def submit_to_pos(results, screenshot_path, cfg, log):
             "Content-Type": "application/json",
         }
 
-        log.info(f"Submitting to POS: {url}")
-        log.debug(f"Payload: {json.dumps(payload, ensure_ascii=False)}")
+        log.info("Submitting to POS: %s", url)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Payload: %s", json.dumps(payload, ensure_ascii=False))
         resp = requests.post(url, json=payload, headers=headers, timeout=30)
-        log.info(f"POS response: {resp.status_code} {resp.text[:200]}")
+        log.info("POS response: %s %s", resp.status_code, resp.text[:200])
     except Exception as e:
-        log.error(f"POS submission failed: {e}")
+        log.error("POS submission failed: %s", e)
 
-    return drive_ok
+    return drive_link
 
 # ---------------------------------------------------------------------------
-# Main
+# Scorecard pipeline: pre-filter → pending frame → OCR verify → extract
 # ---------------------------------------------------------------------------
-def main():
-    cfg = load_config()
-    log = setup_logging(cfg["log_file"])
+GONE_THRESHOLD = 3          # Must be gone for 3 frames (1.5s) to confirm disappeared
 
-    log.info("=" * 60)
-    log.info("Konegolf Score Capture Starting")
-    log.info(f"Script version: {SCRIPT_VERSION}")
-    log.info(f"Bay: {cfg['bay_number']}")
-    log.info(f"Capture interval: {cfg['capture_interval_seconds']}s")
-    log.info(f"Cooldown after detection: {cfg['cooldown_seconds']}s")
-    log.info(f"POS URL: {cfg.get('pos_server_url', 'not configured')}")
-    log.info("=" * 60)
 
-    # Import heavy dependencies
-    log.info("Loading dxcam...")
+class ScorecardPipeline:
+    """Capture-first state machine, shared by the single-process loop and the
+    frame-bus detector process. Feed it frames with process(): it keeps the
+    latest color-matched frame and runs OCR once the scorecard has disappeared.
+    on_confirmed: optional callback run after a scorecard is finalized.
+    """
+
+    def __init__(self, cfg, log, reader, archive=None, on_confirmed=None):
+        self.cfg = cfg
+        self.log = log
+        self.reader = reader
+        self.archive = archive
+        self.on_confirmed = on_confirmed
+        self.geometry = FrameGeometry(cfg)
+        self.pending_frame = None       # The latest color-matched frame (numpy array)
+        self.color_streak = 0           # How many consecutive color-matched frames
+        self.gone_count = 0
+        self.last_finalized_time = 0    # When we last finalized a capture (cooldown anchor)
+
+    def reconfigure(self, cfg):
+        self.cfg = cfg
+        self.geometry.reset(cfg)
+
+    def reset(self):
+        self.pending_frame = None
+        self.color_streak = 0
+        self.gone_count = 0
+
+    def in_cooldown(self):
+        """True (and state cleared) while within cooldown_seconds of the last capture."""
+        if time.time() - self.last_finalized_time < self.cfg["cooldown_seconds"]:
+            self.reset()
+            return True
+        return False
+
+    def cooldown_remaining(self):
+        return int(self.cfg["cooldown_seconds"] - (time.time() - self.last_finalized_time))
+
+    def process(self, frame, frame_count, frame_ok=None):
+        """Run the color pre-filter on one frame, verifying + extracting when a
+        matched scorecard disappears. frame_ok: optional check that frame was not
+        overwritten while being read (frame bus). Returns the color match result.
+        """
+        # Stage 0: Fast color pre-filter (~0ms)
+        with _profiler.stage("prefilter", per_frame=True):
+            color_match = scorecard_color_check(frame, self.geometry.update(frame).prefilter)
+
+        if color_match:
+            # Save/overwrite the pending capture (rolling — always keeps latest)
+            pending = frame.copy()
+            if frame_ok and not frame_ok():
+                self.log.debug("Frame overwritten while copying — skipped")
+                return color_match
+            self.pending_frame = pending
+            self.gone_count = 0
+            self.color_streak += 1
+            if self.color_streak == 1:
+                self.log.info("Color match (%s) — potential scorecard, saving frame...", color_match)
+            elif self.color_streak % 20 == 0:
+                self.log.debug("Color still matching (streak=%s)", self.color_streak)
+        elif self.pending_frame is not None:
+            self.gone_count += 1
+            if self.gone_count >= GONE_THRESHOLD:
+                # Scorecard disappeared — verify the saved frame with OCR
+                self.log.info("Color gone after %s matches — verifying with OCR...", self.color_streak)
+                self._verify(frame_count)
+                self.reset()
+            else:
+                self.log.debug("Color gone (%s/%s) — waiting to confirm", self.gone_count, GONE_THRESHOLD)
+        else:
+            self.color_streak = 0
+            self.gone_count = 0
+        return color_match
+
+    def _verify(self, frame_count):
+        cfg, log = self.cfg, self.log
+        # Run OCR on the pending frame to check for "SCORE CARD"
+        started = time.perf_counter()
+        with _profiler.stage("detect"):
+            is_scorecard, det_text = detect_scorecard(
+                self.pending_frame, self.reader, cfg["detect_region"], log, geometry=self.geometry
+            )
+        log_stage(log, "detect", started, frame_count)
+        if not is_scorecard:
+            log.debug("Color match was false positive (OCR: '%s') — discarding", det_text[:80])
+            return
+
+        log.info("=" * 60)
+        log.info("SCORECARD CONFIRMED by OCR — extracting scores!")
+        log.info("=" * 60)
+        frame = self.pending_frame
+
+        # Save screenshot (archived below once results are known)
+        if not self.archive:
+            screenshot_path = save_screenshot(frame, cfg["capture_save_dir"], prefix="scorecard")
+            log.info("Screenshot saved locally: %s", screenshot_path)
+
+        # Full OCR extraction
+        log.info("Running OCR extraction...")
+        started = time.perf_counter()
+        with _profiler.stage("extract"):
+            results = extract_scores(
+                frame, self.reader, cfg, log,
+                detection_text=det_text, geometry=self.geometry,
+            )
+        log_stage(log, "extract", started, frame_count)
+
+        log.info("-" * 40)
+        log.info("EXTRACTION RESULTS:")
+        log.info("  Course: %s", results.get('course', 'unknown'))
+        for p in results["players"]:
+            nc = p.get('name_confidence', '?')
+            sc = p.get('score_confidence', '?')
+            log.info("  Player: %s (conf=%s) | Score: %s (conf=%s)",
+                     p['name'], nc, p['total_score'], sc)
+        if not results["players"]:
+            log.warning("  No players extracted — OCR may need region tuning")
+        log.info("-" * 40)
+
+        archive_id = None
+        if self.archive:
+            try:
+                archive_id, screenshot_path = self.archive.add(
+                    frame, results, cfg["bay_number"],
+                    jpeg_quality=cfg["archive_jpeg_quality"],
+                )
+                log.info("Capture archived locally: %s", screenshot_path)
+            except Exception as e:
+                log.error("Archive write failed: %s", e)
+                screenshot_path = save_screenshot(frame, cfg["capture_save_dir"], prefix="scorecard")
+
+        # Upload to Google Drive + POS server
+        started = time.perf_counter()
+        with _profiler.stage("upload"):
+            drive_link = submit_to_pos(results, screenshot_path, cfg, log)
+        log_stage(log, "upload", started, frame_count)
+
+        if archive_id is not None:
+            # Archived copy is kept; retention decides when it goes
+            try:
+                if drive_link:
+                    self.archive.set_screenshot_url(archive_id, drive_link)
+                self.archive.enforce_retention(cfg["archive_max_days"], cfg["archive_max_mb"])
+            except Exception as e:
+                log.error("Archive update failed: %s", e)
+        elif drive_link:
+            try:
+                os.remove(screenshot_path)
+                log.debug("Cleaned up local screenshot: %s", screenshot_path)
+            except OSError:
+                pass
+        else:
+            log.info("Keeping local screenshot (Drive upload failed): %s", screenshot_path)
+
+        if self.on_confirmed:
+            self.on_confirmed()
+
+        self.last_finalized_time = time.time()
+        log.info("Cooldown started (%ss)", cfg['cooldown_seconds'])
+        log.info("=" * 60)
+
+
+class StuckDetector:
+    """Flags a frozen screen (identical frames for stuck_alert_minutes).
+    on_stuck: optional callback, run once per stuck episode.
+    Keeps only a downsampled copy of the previous frame, so it is safe to feed
+    it frame-bus views that are overwritten later. update(None) means "no new
+    frame" (dxcam returns None when the desktop has not changed; the frame bus
+    has no newer seq), which counts as an unchanged screen.
+    """
+
+    def __init__(self, cfg, log, on_stuck=None):
+        self.cfg = cfg
+        self.log = log
+        self.on_stuck = on_stuck
+        self.prev_small = None
+        self.stuck_since = None         # When the screen stopped changing
+        self.reported = False           # Only alert once per stuck episode
+
+    def update(self, frame):
+        if frame is None:
+            frame_diff = 0.0
+        else:
+            with _profiler.stage("stuck_check", per_frame=True):
+                small = frame[::10, ::10].copy()
+                frame_diff = calculate_frame_diff(small, self.prev_small, step=1)
+                self.prev_small = small
+        if frame_diff < self.cfg["stuck_threshold"]:
+            if self.stuck_since is None:
+                self.stuck_since = time.time()
+            elif (not self.reported and
+                    time.time() - self.stuck_since > self.cfg["stuck_alert_minutes"] * 60):
+                self.log.warning("BAY STUCK for %ss — screen frozen!", int(time.time() - self.stuck_since))
+                self.reported = True
+                if self.on_stuck:
+                    self.on_stuck()
+        else:
+            if self.reported:
+                self.log.info("Screen changing again — no longer stuck")
+            self.stuck_since = None
+            self.reported = False
+
+
+def take_replay_request(cfg):
+    """True if --dump-replay left a trigger file (the file is consumed)."""
+    if not os.path.exists(cfg["replay_trigger_file"]):
+        return False
     try:
-        import dxcam
-    except ImportError:
-        log.error("dxcam not installed. Run: pip install dxcam")
-        sys.exit(1)
+        os.remove(cfg["replay_trigger_file"])
+    except OSError:
+        pass
+    return True
+
+
+def apply_config_reload(watcher, cfg, log):
+    """Swap in a validated config.json change between frames.
+    Returns (cfg, changed_keys) — changed_keys is empty when nothing changed.
+    """
+    reloaded = watcher.take() if watcher else None
+    if not reloaded:
+        return cfg, []
+    cfg, changed = reloaded
+    try:
+        _profiler.configure(cfg, log)
+    except Exception as e:
+        log.error("Could not apply profile settings — profiling unchanged: %s", e)
+    if any(k in UPLOAD_KEYS for k in changed):
+        reset_upload_targets()
+    if watcher.report:
+        log.info("Config reloaded — applied: %s", ', '.join(changed))
+    return cfg, changed
+
 
+def open_archive(cfg, log):
+    if not cfg["archive_enabled"]:
+        return None
+    try:
+        archive = CaptureArchive(cfg["archive_dir"], log)
+        archive.enforce_retention(cfg["archive_max_days"], cfg["archive_max_mb"])
+        log.info("Capture archive: %s/ (keep %s days / %sMB)",
+                 cfg["archive_dir"], cfg["archive_max_days"], cfg["archive_max_mb"])
+        return archive
+    except Exception as e:
+        log.error("Could not open capture archive, falling back to %s: %s",
+                  cfg["capture_save_dir"], e)
+        return None
+
+
+def load_ocr(log):
+    """Import and initialize PaddleOCR (slow — up to a minute on first run)."""
     log.info("Loading PaddleOCR (this may take a minute on first run)...")
     # Workaround: some bay PCs lack root CA certs, causing SSL errors
     # when models are downloaded on first run.
@@ -672,159 +2229,482 @@ def main():
         log.error("paddleocr not installed. Run: pip install paddlepaddle paddleocr")
         sys.exit(1)
 
-    # Initialize
-    log.info("Initializing DXGI capture...")
-    try:
-        camera = dxcam.create()
-        log.info("DXGI camera ready")
-    except Exception as e:
-        log.error(f"Failed to create DXGI camera: {e}")
-        sys.exit(1)
-
     log.info("Initializing PaddleOCR (lang=en)...")
     try:
         reader = PaddleOCR(lang="en")
         log.info("PaddleOCR ready")
+        return reader
     except Exception as e:
-        log.error(f"Failed to initialize PaddleOCR: {e}")
+        log.error("Failed to initialize PaddleOCR: %s", e)
         sys.exit(1)
 
+
+# ---------------------------------------------------------------------------
+# Frame bus: one grabber, many consumer processes (frame_bus_enabled)
+# ---------------------------------------------------------------------------
+# The grabber copies each frame once into a ring of slots in shared memory.
+# Consumers (scorecard detector, health monitor, replay recorder) run in their
+# own processes and read the newest frame as a numpy view — no pickling, no
+# extra copies, and no GIL shared with the grabber or each other.
+class FrameBus:
+    """Shared-memory frame ring with per-slot sequence numbers.
+    A slot's sequence number is -1 while it is being written. Readers take the
+    newest frame with latest() and confirm with valid(seq) after using it; a slow
+    reader simply skips ahead to the newest frame, it never blocks the grabber.
+    """
+
+    def __init__(self, name, shape, slots, create=False):
+        import numpy as np
+        from multiprocessing import shared_memory
+        self.name = name
+        self.shape = tuple(shape)
+        self.slots = slots
+        header_bytes = 8 * (1 + slots)     # latest seq + one seq per slot
+        frame_bytes = int(np.prod(self.shape))
+        if create:
+            self.shm = shared_memory.SharedMemory(
+                name=name, create=True, size=header_bytes + frame_bytes * slots
+            )
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = create
+        self._latest = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self._slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf, offset=8)
+        self._frames = np.ndarray(
+            (slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes
+        )
+        if create:
+            self._latest[0] = 0
+            self._slot_seq[:] = -1
+
+    @property
+    def spec(self):
+        """Picklable (name, shape, slots) for attaching from a consumer process."""
+        return self.name, self.shape, self.slots
+
+    def publish(self, frame):
+        import numpy as np
+        seq = int(self._latest[0]) + 1
+        slot = seq % self.slots
+        self._slot_seq[slot] = -1
+        np.copyto(self._frames[slot], frame)
+        self._slot_seq[slot] = seq
+        self._latest[0] = seq
+        return seq
+
+    def latest(self, after=0):
+        """Return (seq, view) of the newest frame newer than `after`, or (after, None)."""
+        seq = int(self._latest[0])
+        if seq <= after:
+            return after, None
+        slot = seq % self.slots
+        if self._slot_seq[slot] != seq:
+            return after, None
+        return seq, self._frames[slot]
+
+    def valid(self, seq):
+        """True if the frame read as seq has not been overwritten since."""
+        return int(self._slot_seq[seq % self.slots]) == seq
+
+    def close(self):
+        # Views must be released before the segment can be closed
+        self._latest = self._slot_seq = self._frames = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except Exception:
+            pass
+
+
+def _consumer_logging(cfg, log_queue):
+    return setup_logging(cfg, log_queue=log_queue, listen=False)
+
+
+def run_detector_process(bus_spec, cfg, overrides, log_queue, events, stop):
+    """Consumer: scorecard pre-filter → OCR → archive/upload, at capture_interval_seconds."""
+    log = _consumer_logging(cfg, log_queue)
+    reader = load_ocr(log)
+    archive = open_archive(cfg, log)
+    _profiler.process = "detector"
+    _profiler.configure(cfg, log)
+    on_confirmed = (lambda: events.put(("dump", "scorecard"))) if events is not None else None
+    pipeline = ScorecardPipeline(cfg, log, reader, archive, on_confirmed=on_confirmed)
+    watcher = (ConfigWatcher(cfg, log, overrides=overrides, report=False)
+               if cfg["config_poll_seconds"] > 0 else None)
+    bus = FrameBus(*bus_spec)
+    seq = frame_count = missed = 0
+    log.info("Scorecard detector attached to frame bus")
+    try:
+        while not stop.is_set():
+            time.sleep(cfg["capture_interval_seconds"])
+            cfg, changed = apply_config_reload(watcher, cfg, log)
+            if changed:
+                pipeline.reconfigure(cfg)
+            if pipeline.in_cooldown():
+                continue
+            _profiler.tick()
+            prev_seq = seq
+            seq, frame = bus.latest(seq)
+            if frame is None:
+                continue
+            missed += max(seq - prev_seq - 1, 0) if prev_seq else 0
+            frame_count += 1
+            pipeline.process(frame, frame_count, frame_ok=lambda: bus.valid(seq))
+            frame = None
+            if frame_count % 120 == 0:
+                log.debug("Detector at frame seq %s (skipped %s so far)", seq, missed)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.error("Detector process error: %s", e, exc_info=True)
+    finally:
+        if watcher:
+            watcher.close()
+        _profiler.dump()
+        if archive:
+            archive.close()
+        bus.close()
+
+
+def run_health_process(bus_spec, cfg, overrides, log_queue, events, stop):
+    """Consumer: stuck-screen detection, at health_check_interval_seconds."""
+    log = _consumer_logging(cfg, log_queue)
+    on_stuck = (lambda: events.put(("dump", "stuck"))) if events is not None else None
+    stuck = StuckDetector(cfg, log, on_stuck=on_stuck)
+    watcher = (ConfigWatcher(cfg, log, overrides=overrides, report=False)
+               if cfg["config_poll_seconds"] > 0 else None)
+    bus = FrameBus(*bus_spec)
+    seq = 0
+    try:
+        while not stop.is_set():
+            time.sleep(cfg["health_check_interval_seconds"])
+            cfg, changed = apply_config_reload(watcher, cfg, log)
+            if changed:
+                stuck.cfg = cfg
+            # No newer seq means the grabber got no new desktop frame — an
+            # unchanged screen. A frame torn by an overwrite can only look
+            # "changed", never frozen, so no validity check is needed here.
+            seq, frame = bus.latest(seq)
+            stuck.update(frame)
+            frame = None
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.error("Health process error: %s", e, exc_info=True)
+    finally:
+        if watcher:
+            watcher.close()
+        bus.close()
+
+
+def run_recorder_process(bus_spec, cfg, overrides, log_queue, events, stop):
+    """Consumer: feeds the replay buffer and writes clips on request."""
+    import queue
+    log = _consumer_logging(cfg, log_queue)
+    replay = ReplayBuffer(cfg, log)
+    watcher = (ConfigWatcher(cfg, log, overrides=overrides, report=False)
+               if cfg["config_poll_seconds"] > 0 else None)
+    bus = FrameBus(*bus_spec)
+    seq = 0
+    try:
+        while not stop.is_set():
+            time.sleep(cfg["capture_interval_seconds"])
+            cfg, _ = apply_config_reload(watcher, cfg, log)
+            while True:
+                try:
+                    kind, reason = events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "dump":
+                    replay.dump(reason)
+            if take_replay_request(cfg):
+                replay.dump("manual")
+            seq, frame = bus.latest(seq)
+            if frame is None:
+                continue
+            # The encoder works asynchronously, so it needs its own copy
+            copy = frame.copy()
+            frame = None
+            if bus.valid(seq):
+                replay.push(copy)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.error("Recorder process error: %s", e, exc_info=True)
+    finally:
+        if watcher:
+            watcher.close()
+        replay.close()
+        bus.close()
+
+
+def run_frame_bus(cfg, overrides, log, log_queue, camera):
+    """Grabber: publish frames to the bus and supervise the consumer processes."""
+    import multiprocessing as mp
+
+    log.info("Frame bus mode — waiting for first frame...")
+    frame = None
+    while frame is None:
+        frame = camera.grab()
+        if frame is None:
+            time.sleep(cfg["capture_interval_seconds"])
+    bus = FrameBus(f"konegolf_bay{cfg['bay_number']}_{os.getpid()}", frame.shape,
+                   cfg["frame_bus_slots"], create=True)
+    bus.publish(frame)
+    log.info("Frame bus ready: %s slots of %s", bus.slots, "x".join(str(d) for d in bus.shape))
+
+    stop = mp.Event()
+    events = mp.Queue() if cfg["replay_enabled"] else None
+    targets = {"detector": run_detector_process, "health": run_health_process}
+    if cfg["replay_enabled"]:
+        targets["recorder"] = run_recorder_process
+
+    def start(name):
+        proc = mp.Process(
+            target=targets[name], args=(bus.spec, cfg, overrides, log_queue, events, stop),
+            name=f"capture-{name}", daemon=True,
+        )
+        proc.start()
+        return proc
+
+    procs = {name: start(name) for name in targets}
+    log.info("Started consumers: %s", ", ".join(procs))
+
+    watcher = ConfigWatcher(cfg, log, overrides=overrides) if cfg["config_poll_seconds"] > 0 else None
+    frame_count = 0
+    last_check = time.time()
+    shape_warned = False
+    try:
+        while True:
+            time.sleep(cfg["capture_interval_seconds"])
+            cfg, _ = apply_config_reload(watcher, cfg, log)
+            _profiler.tick()
+            grab_started = time.perf_counter()
+            with _profiler.stage("grab", per_frame=True):
+                frame = camera.grab()
+            grab_ms = (time.perf_counter() - grab_started) * 1000
+            frame_count += 1
+            if frame is None:
+                if frame_count % 60 == 0:
+                    log.debug("Empty frame (screen idle)")
+                continue
+            if frame.shape != bus.shape:
+                if not shape_warned:
+                    log.error("Screen resolution changed to %s — restart capture to resize the frame bus",
+                              "x".join(str(d) for d in frame.shape))
+                    shape_warned = True
+                continue
+            with _profiler.stage("publish", per_frame=True):
+                seq = bus.publish(frame)
+
+            if frame_count % 120 == 0:
+                log.debug("Frame #%s published (seq %s), grab: %.1fms",
+                          frame_count, seq, grab_ms,
+                          extra={"frame": frame_count, "stage": "grab", "duration_ms": round(grab_ms, 1)})
+
+            # Supervise consumers — restart any that died
+            if time.time() - last_check > 10:
+                last_check = time.time()
+                for name, proc in list(procs.items()):
+                    if not proc.is_alive():
+                        log.error("Consumer %s exited (code %s) — restarting", name, proc.exitcode)
+                        procs[name] = start(name)
+    except KeyboardInterrupt:
+        log.info("Stopped by user (Ctrl+C)")
+    except Exception as e:
+        log.error("Unexpected error: %s", e, exc_info=True)
+    finally:
+        stop.set()
+        for proc in procs.values():
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        if watcher:
+            watcher.close()
+        _profiler.dump()
+        bus.close()
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+def run_single_process(cfg, overrides, log, camera):
+    """Original one-loop mode: grab, replay, stuck check and detection in turn."""
+    reader = load_ocr(log)
+
+    replay = None
+    if cfg["replay_enabled"]:
+        replay = ReplayBuffer(cfg, log)
+        log.info("Replay buffer: last %ss, max %sMB (dump: python capture.py --dump-replay)",
+                 cfg['replay_seconds'], cfg['replay_max_mb'])
+
+    archive = open_archive(cfg, log)
+    pipeline = ScorecardPipeline(
+        cfg, log, reader, archive,
+        on_confirmed=(lambda: replay.dump("scorecard")) if replay else None,
+    )
+    stuck = StuckDetector(cfg, log, on_stuck=(lambda: replay.dump("stuck")) if replay else None)
+
+    watcher = None
+    if cfg["config_poll_seconds"] > 0:
+        watcher = ConfigWatcher(cfg, log, overrides=overrides)
+        log.info("Watching %s for changes (every %ss)", CONFIG_FILE, cfg['config_poll_seconds'])
+
     log.info("Capture loop started. Watching for scorecard...")
     log.info("Strategy: color pre-filter (0.5s) → save on match → OCR verify after gone.")
     log.info("Captures frame instantly on color match; verifies with OCR after scorecard disappears.")
 
     frame_count = 0
-    pending_frame = None        # The latest color-matched frame (numpy array)
-    pending_path = None         # Path to saved pending capture file
-    color_streak = 0            # How many consecutive color-matched frames
-    last_finalized_time = 0     # When we last finalized a capture (cooldown anchor)
-    GONE_THRESHOLD = 3          # Must be gone for 3 frames (1.5s) to confirm disappeared
-
-    gone_count = 0
-
     try:
         while True:
             time.sleep(cfg["capture_interval_seconds"])
 
+            # Hot-reload: swap in a validated config.json change between frames
+            cfg, changed = apply_config_reload(watcher, cfg, log)
+            if changed:
+                pipeline.reconfigure(cfg)
+                stuck.cfg = cfg
+
+            # On-demand replay dump (trigger file written by --dump-replay)
+            if take_replay_request(cfg):
+                if replay:
+                    replay.dump("manual")
+                else:
+                    log.info("Replay dump requested but replay buffer is disabled")
+
+            # Grab frame — also during cooldown, so stuck time keeps accumulating
+            _profiler.tick()
+            grab_started = time.perf_counter()
+            with _profiler.stage("grab", per_frame=True):
+                frame = camera.grab()
+            grab_ms = (time.perf_counter() - grab_started) * 1000
+            frame_count += 1
+
+            # Stuck screen check — frozen frames for several minutes.
+            # A None grab means the desktop has not changed since the last one.
+            stuck.update(frame)
+
             # Cooldown — don't re-detect within cooldown window
-            if time.time() - last_finalized_time < cfg["cooldown_seconds"]:
-                remaining = int(cfg["cooldown_seconds"] - (time.time() - last_finalized_time))
+            if pipeline.in_cooldown():
                 if frame_count % 120 == 0:
-                    log.debug(f"Cooldown active, {remaining}s remaining")
-                frame_count += 1
-                color_streak = 0
-                pending_frame = None
-                pending_path = None
-                gone_count = 0
+                    log.debug("Cooldown active, %ss remaining", pipeline.cooldown_remaining())
                 continue
 
-            # Grab frame
-            frame = camera.grab()
-            frame_count += 1
-
             if frame is None:
                 if frame_count % 60 == 0:
                     log.debug("Empty frame (screen idle)")
                 continue
 
-            # Stage 0: Fast color pre-filter (~0ms)
-            color_match = scorecard_color_check(frame)
-
-            if color_match:
-                gone_count = 0
-                color_streak += 1
-                # Save/overwrite the pending capture (rolling — always keeps latest)
-                pending_frame = frame.copy()
-                if color_streak == 1:
-                    log.info("Color match — potential scorecard, saving frame...")
-                elif color_streak % 20 == 0:
-                    log.debug(f"Color still matching (streak={color_streak})")
-            else:
-                # Color doesn't match
-                if pending_frame is not None:
-                    gone_count += 1
-                    if gone_count >= GONE_THRESHOLD:
-                        # Scorecard disappeared — verify the saved frame with OCR
-                        log.info(f"Color gone after {color_streak} matches — verifying with OCR...")
-
-                        # Run OCR on the pending frame to check for "SCORE CARD"
-                        is_scorecard, det_text = detect_scorecard(
-                            pending_frame, reader, cfg["detect_region"], log
-                        )
-
-                        if is_scorecard:
-                            log.info("=" * 60)
-                            log.info(f"SCORECARD CONFIRMED by OCR — extracting scores!")
-                            log.info("=" * 60)
-
-                            # Save screenshot
-                            screenshot_path = save_screenshot(
-                                pending_frame, cfg["capture_save_dir"], prefix="scorecard"
-                            )
-                            log.info(f"Screenshot saved locally: {screenshot_path}")
-
-                            # Full OCR extraction
-                            log.info("Running OCR extraction...")
-                            results = extract_scores(
-                                pending_frame, reader, cfg, log,
-                                detection_text=det_text,
-                            )
-
-                            log.info("-" * 40)
-                            log.info("EXTRACTION RESULTS:")
-                            log.info(f"  Course: {results.get('course', 'unknown')}")
-                            for p in results["players"]:
-                                nc = p.get('name_confidence', '?')
-                                sc = p.get('score_confidence', '?')
-                                log.info(f"  Player: {p['name']} (conf={nc}) | Score: {p['total_score']} (conf={sc})")
-                            if not results["players"]:
-                                log.warning("  No players extracted — OCR may need region tuning")
-                            log.info("-" * 40)
-
-                            # Upload to Google Drive + POS server
-                            drive_ok = submit_to_pos(results, screenshot_path, cfg, log)
-
-                            if drive_ok:
-                                try:
-                                    os.remove(screenshot_path)
-                                    log.debug(f"Cleaned up local screenshot: {screenshot_path}")
-                                except OSError:
-                                    pass
-                            else:
-                                log.info(f"Keeping local screenshot (Drive upload failed): {screenshot_path}")
-
-                            last_finalized_time = time.time()
-                            log.info(f"Cooldown started ({cfg['cooldown_seconds']}s)")
-                            log.info("=" * 60)
-                        else:
-                            log.debug(f"Color match was false positive (OCR: '{det_text[:80]}') — discarding")
-
-                        # Reset state
-                        pending_frame = None
-                        pending_path = None
-                        color_streak = 0
-                        gone_count = 0
-                    else:
-                        log.debug(f"Color gone ({gone_count}/{GONE_THRESHOLD}) — waiting to confirm")
-                else:
-                    color_streak = 0
-                    gone_count = 0
+            if replay:
+                replay.push(frame)
+
+            color_match = pipeline.process(frame, frame_count)
 
             if frame_count % 120 == 0:
-                log.debug(f"Frame #{frame_count} — color: {color_match}, streak: {color_streak}")
+                log.debug("Frame #%s — color: %s, streak: %s, grab: %.1fms",
+                          frame_count, color_match, pipeline.color_streak, grab_ms,
+                          extra={"frame": frame_count, "stage": "grab", "duration_ms": round(grab_ms, 1)})
 
     except KeyboardInterrupt:
         log.info("Stopped by user (Ctrl+C)")
     except Exception as e:
-        log.error(f"Unexpected error: {e}", exc_info=True)
+        log.error("Unexpected error: %s", e, exc_info=True)
+    finally:
+        if replay:
+            replay.close()
+        if watcher:
+            watcher.close()
+        _profiler.dump()
+        if archive:
+            archive.close()
+
+
+def main(args):
+    cfg = load_config()
+    overrides = {"profile_enabled": True} if args.profile else {}
+    cfg.update(overrides)
+    # Validate before logging is set up — the log settings themselves may be bad
+    errors = validate_config(cfg)
+    if errors:
+        print(f"ERROR: invalid {CONFIG_FILE}: {'; '.join(errors)}")
+        sys.exit(1)
+    log_queue = None
+    if cfg["frame_bus_enabled"]:
+        import multiprocessing as mp
+        log_queue = mp.Queue(-1)    # consumer processes log through the main process
+    log = setup_logging(cfg, log_queue=log_queue)
+
+    log.info("=" * 60)
+    log.info("Konegolf Score Capture Starting")
+    log.info("Script version: %s", SCRIPT_VERSION)
+    log.info("Bay: %s", cfg['bay_number'])
+    log.info("Capture interval: %ss", cfg['capture_interval_seconds'])
+    log.info("Cooldown after detection: %ss", cfg['cooldown_seconds'])
+    log.info("POS URL: %s", cfg.get('pos_server_url', 'not configured'))
+    log.info("=" * 60)
+
+    # Import heavy dependencies
+    log.info("Loading dxcam...")
+    try:
+        import dxcam
+    except ImportError:
+        log.error("dxcam not installed. Run: pip install dxcam")
+        sys.exit(1)
+
+    # Initialize
+    log.info("Initializing DXGI capture...")
+    try:
+        camera = dxcam.create()
+        log.info("DXGI camera ready")
+    except Exception as e:
+        log.error("Failed to create DXGI camera: %s", e)
+        sys.exit(1)
+
+    _profiler.configure(cfg, log)
+    try:
+        if cfg["frame_bus_enabled"]:
+            run_frame_bus(cfg, overrides, log, log_queue, camera)
+        else:
+            run_single_process(cfg, overrides, log, camera)
     finally:
         del camera
         log.info("Camera released. Exiting.")
 
 
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Konegolf Score Capture")
+    parser.add_argument("--auth", action="store_true", help="one-time Google Drive login")
+    parser.add_argument("--dump-replay", action="store_true",
+                        help="ask the running capture to save a replay clip")
+    parser.add_argument("--profile", action="store_true", help="profile capture + extraction stages")
+    query = parser.add_argument_group("archive query")
+    query.add_argument("--query", action="store_true", help="search the local capture archive")
+    query.add_argument("--bay", type=int, help="bay number")
+    query.add_argument("--date", help="date as YYYY-MM-DD")
+    query.add_argument("--player", help="player name (case-insensitive, exact)")
+    query.add_argument("--course", help="course name (substring)")
+    query.add_argument("--limit", type=int, default=100, help="max results (default 100)")
+    query.add_argument("--json", action="store_true", help="print results as JSON")
+    calib = parser.add_argument_group("prefilter calibration")
+    calib.add_argument("--calibrate", metavar="DIR",
+                       help="derive a color profile from DIR/positive and DIR/negative frames")
+    calib.add_argument("--name", default="scorecard", help="profile name (default: scorecard)")
+    calib.add_argument("--points", type=int, default=6, help="sample points to pick (default 6)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    if "--auth" in sys.argv:
+    args = parse_args()
+    if args.auth:
         cfg = load_config()
         run_auth_flow(cfg)
+    elif args.dump_replay:
+        request_replay_dump(load_config())
+    elif args.query:
+        run_archive_query(load_config(), args)
+    elif args.calibrate:
+        run_calibration(load_config(), args)
     else:
-        main()
+        main(args)